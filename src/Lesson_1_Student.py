@@ -3,11 +3,16 @@ import re
 import httpx
 import os
 from dotenv import load_dotenv
+from react_helper import ActionRunner, ReActStreamParser, run_actions, format_observation
+from context_window import ContextWindow
 
 _ = load_dotenv()
 from openai import OpenAI
 
-client = OpenAI()
+# identical (temperature 0) requests are answered from an on-disk cache, see response_cache.py:
+from response_cache import ResponseCache
+response_cache = ResponseCache()
+client = response_cache.wrap_openai(OpenAI())
 
 # hello world test:
 chat_completion = client.chat.completions.create(
@@ -18,8 +23,10 @@ print(chat_completion.choices[0].message.content)
 # 'Hello! How can I assist you today?'
 
 class Agent:
-    def __init__(self, system=""):
+    # context: optional ContextWindow (see context_window.py) that keeps the prompt within a token budget
+    def __init__(self, system="", context=None):
         self.system = system
+        self.context = context
         self.messages = []
         if self.system:
             self.messages.append({"role": "system", "content": system})
@@ -34,8 +41,54 @@ class Agent:
         completion = client.chat.completions.create(
                         model="gpt-4o", 
                         temperature=0,
-                        messages=self.messages)
+                        messages=self.prompt_messages())
         return completion.choices[0].message.content
+
+    def prompt_messages(self):
+        # self.messages keeps the whole history, only the context window is sent:
+        if self.context is None:
+            return self.messages
+        messages = self.context.build(self.messages)
+        if self.context.last_saved:
+            print(" -- context window saved {} tokens".format(self.context.last_saved))
+        return messages
+
+    def stream(self, message, on_action=None):
+        """Like calling the agent, but on_action(action, action_input) runs as soon as an Action line is complete"""
+        self.messages.append({"role": "user", "content": message})
+        result = self.execute_stream(on_action)
+        self.messages.append({"role": "assistant", "content": result})
+        return result
+
+    def execute_stream(self, on_action=None):
+        parser = ReActStreamParser()
+        # the stop sequence ends generation at PAUSE, so we don't pay for anything written after it:
+        stream = client.chat.completions.create(
+                        model="gpt-4o",
+                        temperature=0,
+                        messages=self.prompt_messages(),
+                        stop=["PAUSE"],
+                        stream=True)
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    for action in parser.feed(delta):
+                        if on_action:
+                            on_action(*action)
+                if parser.paused:
+                    break
+        finally:
+            # cancels the request if we stopped reading early
+            stream.close()
+        for action in parser.close():
+            if on_action:
+                on_action(*action)
+        text = parser.text.rstrip()
+        # keep the history in the Thought/Action/PAUSE format of the prompt:
+        if parser.actions and not text.endswith("PAUSE"):
+            text += "\nPAUSE"
+        return text
     
 prompt = """
 You run in a loop of Thought, Action, PAUSE, Observation.
@@ -70,18 +123,16 @@ You then output:
 Answer: A bulldog weights 51 lbs
 """.strip()
 
+# eval(what) would run any Python the model writes, so only arithmetic is accepted
+# (parsed once and cached, see safe_calc.py):
+from safe_calc import calculate as safe_calculate
+
 def calculate(what):
-    return eval(what)
-
-def average_dog_weight(name):
-    if name in "Scottish Terrier": 
-        return("Scottish Terriers average 20 lbs")
-    elif name in "Border Collie":
-        return("a Border Collies average weight is 37 lbs")
-    elif name in "Toy Poodle":
-        return("a toy poodles average weight is 7 lbs")
-    else:
-        return("An average dog weights 50 lbs")
+    return safe_calculate(what)
+
+# the breeds live in dog_breeds.csv, loaded once into a hash index (exact names)
+# and a trigram index (misspelled or partial names, see dog_breeds.py):
+from dog_breeds import average_dog_weight
 
 known_actions = {
     "calculate": calculate,
@@ -136,12 +187,38 @@ print(abot(next_prompt))
 
 # add loop
 action_re = re.compile('^Action: (\w+): (.*)$')   # python regular expression to selection action
-def query(question, max_turns=5):
+
+# multi-action mode: the model may ask for several independent actions in one turn
+multi_prompt = prompt.replace(
+    "Use Action to run one of the actions available to you - then return PAUSE.",
+    "Use Action to run one of the actions available to you - then return PAUSE.\n"
+    "If you need several actions that do not depend on each other, output one Action line "
+    "for each of them before PAUSE.")
+
+def query(question, max_turns=5, multi_action=False, stream=False, max_workers=4, timeout=10):
     i = 0
-    bot = Agent(prompt)
+    bot = Agent(multi_prompt if multi_action else prompt)
     next_prompt = question
     while i < max_turns:
         i += 1
+        if stream:
+            # every action starts as soon as its Action line has been streamed,
+            # instead of after the whole completion has arrived:
+            runner = ActionRunner(known_actions, max_workers=max_workers, timeout=timeout)
+            def dispatch(action, action_input):
+                if multi_action or not runner.pending:
+                    runner.submit(action, action_input)
+            try:
+                result = bot.stream(next_prompt, on_action=dispatch)
+                print(result)
+                results = runner.collect()
+            finally:  # also when the stream or an action fails
+                runner.shutdown()
+            if not results:
+                return
+            next_prompt = format_observation(results)
+            print(next_prompt)
+            continue
         result = bot(next_prompt)
         print(result)
         actions = [
@@ -149,7 +226,14 @@ def query(question, max_turns=5):
             for a in result.split('\n') 
             if action_re.match(a)
         ]
-        if actions:
+        if actions and multi_action:
+            # run all actions of this turn concurrently (each limited by timeout)
+            # and send back one combined Observation, saving one LLM round trip per extra action:
+            results = run_actions([a.groups() for a in actions], known_actions,
+                                  max_workers=max_workers, timeout=timeout)
+            next_prompt = format_observation(results)
+            print(next_prompt)
+        elif actions:
             # There is an action to run
             action, action_input = actions[0].groups()
             if action not in known_actions:
@@ -177,4 +261,36 @@ print(query(question))
 # PAUSE
 #  -- running calculate 37 + 20
 # Observation: 57
-# Answer: The combined weight of a Border Collie and a Scottish Terrier is 57 lbs.
\ No newline at end of file
+# Answer: The combined weight of a Border Collie and a Scottish Terrier is 57 lbs.
+
+# same question in multi-action mode: both average_dog_weight actions should be requested
+# (and run concurrently) in the first turn, so one LLM turn less than above:
+print(query(question, multi_action=True))
+
+# streaming mode: the tools are dispatched while the answer is still streaming in,
+# and generation stops at PAUSE:
+print(query(question, multi_action=True, stream=True))
+
+# long sessions: keep the system prompt and the last 3 turns, fold older turns into a summary
+# once the prompt would exceed 1000 tokens:
+abot = Agent(prompt, context=ContextWindow(max_tokens=1000, keep_turns=3))
+print(abot("How much does a toy poodle weigh?"))
+print(abot.context.report())
+
+# many questions at once: asyncio batch runner on one shared AsyncOpenAI client,
+# limited in requests and tokens per minute (see batch_runner.py)
+import asyncio
+from batch_runner import run_queries, BatchStats
+
+async def run_batch(questions, concurrency=8):
+    stats = BatchStats()
+    async for r in run_queries(questions, multi_prompt, known_actions, concurrency=concurrency, stats=stats):
+        # results arrive as soon as each question is done
+        print(r["index"], r["answer"] or r["error"])
+    print(stats.report())
+
+asyncio.run(run_batch([
+    "How much does a toy poodle weigh?",
+    question,
+    "What is the combined weight of a beagle, a pug and a dachshund?",
+]))
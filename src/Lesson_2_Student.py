@@ -1,13 +1,17 @@
 from dotenv import load_dotenv
 _ = load_dotenv()
+from cassette import use_cassette
+use_cassette()  # CASSETTE_MODE=record|replay records the OpenAI/Tavily traffic or serves it offline
 
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated
 import operator
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
+from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage
 # wrapper around openAI API, as LangChain has a standard interface for all LLMs it supports:
 from langchain_openai import ChatOpenAI 
 from langchain_community.tools.tavily_search import TavilySearchResults
+from agent_tools import run_tool_calls
+from message_log import append_messages, with_system
 
 tool = TavilySearchResults(max_results=2) #increased number of results
 # "tavily_search_results_json" is the tool's name that the LLM will use:
@@ -20,16 +24,24 @@ class AgentState(TypedDict):
 # why is messages not treated as an attribute of Agent (see below)? / 
 # why are the Agent attributes (like tools, model) not in AgentState?
 # Because messages is the only variable being mutated during graph traversal, i.e. during agent use!?
-    messages: Annotated[list[AnyMessage], operator.add]
+    # append_messages works like operator.add, but appends to a shared append-only log
+    # instead of copying the whole history on every step (see message_log.py):
+    messages: Annotated[list[AnyMessage], append_messages]
 # see https://docs.python.org/3/library/typing.html
 
 class Agent:
 
-    def __init__(self, model, tools, system=""):
+    def __init__(self, model, tools, system="", metrics=None):
         self.system = system
+        # optional GraphMetrics: time per node and tool call, tokens and cost per LLM call (see graph_metrics.py)
+        self.metrics = metrics
         graph = StateGraph(AgentState)
-        graph.add_node("llm", self.call_openai)
-        graph.add_node("action", self.take_action)
+        if metrics is not None:
+            graph.add_node("llm", metrics.wrap_node("llm", self.call_openai))
+            graph.add_node("action", metrics.wrap_node("action", self.take_action))
+        else:
+            graph.add_node("llm", self.call_openai)
+            graph.add_node("action", self.take_action)
         graph.add_conditional_edges(
             "llm",
             self.exists_action,
@@ -42,6 +54,8 @@ class Agent:
         self.tools = {t.name: t for t in tools}
         # let the model know about the tools:
         self.model = model.bind_tools(tools) 
+        if metrics is not None:
+            self.model = metrics.instrument_model(self.model)
 
     def exists_action(self, state: AgentState):
         result = state['messages'][-1]
@@ -51,7 +65,8 @@ class Agent:
     def call_openai(self, state: AgentState):
         messages = state['messages']
         if self.system:
-            messages = [SystemMessage(content=self.system)] + messages
+            # a view of system prompt + log, the log itself is not copied:
+            messages = with_system(SystemMessage(content=self.system), messages)
         message = self.model.invoke(messages)
         # due to operator.add, messages gets extended:
         return {'messages': [message]} 
@@ -59,17 +74,13 @@ class Agent:
     def take_action(self, state: AgentState):
         # parallel tool calls allowed (see also "together" in sys msg):
         tool_calls = state['messages'][-1].tool_calls
-        results = []
         for t in tool_calls:
             print(f"Calling: {t}")
-            # check for bad tool name from LLM:
-            if not t['name'] in self.tools:      
-                print("\n ....bad tool name....")
-                # instruct LLM to retry if bad:
-                result = "bad tool name, retry"  
-            else:
-                result = self.tools[t['name']].invoke(t['args'])
-            results.append(ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result)))
+        # the calls run concurrently, so e.g. the SF and LA searches take as long as the slower one;
+        # bad tool names, failures and timeouts come back as error messages (see agent_tools.py).
+        # compact=True keeps only the relevant fields of the Tavily results in the history
+        # (the raw results are available through agent_tools.get_raw_result(tool_call_id)):
+        results = run_tool_calls(self.tools, tool_calls, compact=True, metrics=self.metrics)
         print("Back to the model!")
         # extends `messages` with up to len(tool_calls) messages:
         return {'messages': results} 
@@ -80,12 +91,19 @@ Only look up information when you are sure of what you want. \
 If you need to look up some information before asking a follow up question, you are allowed to do that!
 """
 
+# identical temperature-0 requests are answered from an on-disk cache (see response_cache.py;
+# enable_cache(sampled=True) caches sampled completions too), use `with response_cache.bypass():`
+# to force a fresh completion. Off (None) with RESPONSE_CACHE=off and while recording a cassette:
+from response_cache import enable_cache
+response_cache = enable_cache()
+
 #reduce inference cost:
 model = ChatOpenAI(model="gpt-3.5-turbo")  
 abot = Agent(model, [tool], system=prompt)
 
-from IPython.display import Image
-Image(abot.graph.get_graph().draw_png())
+# renders in a notebook only (see graph_display.py):
+from graph_display import show_graph
+show_graph(abot.graph)
 
 # Prepare the state that the agent expects to work with:
 messages = [HumanMessage(content="What is the weather in sf?")]
@@ -117,16 +135,32 @@ query = "Who won the super bowl in 2024? In what state is the winning team headq
 What is the GDP of that state? Answer each question." 
 messages = [HumanMessage(content=query)]
 
-model = ChatOpenAI(model="gpt-4o")  # requires more advanced model
-abot = Agent(model, [tool], system=prompt)
+# requires more advanced model -- instead of switching to gpt-4o by hand, let a cascade decide:
+# every step goes to gpt-3.5-turbo first and is only escalated to gpt-4o for multi-hop questions
+# like this one, failed or malformed tool calls, empty or unsure answers (see CascadeRouter in agent_graph.py)
+cheap_model = ChatOpenAI(model="gpt-3.5-turbo")
+strong_model = ChatOpenAI(model="gpt-4o")
+# record where the tokens and seconds go (see graph_metrics.py):
+from graph_metrics import GraphMetrics
+metrics = GraphMetrics()
+# a new Agent builds and compiles the graph and converts the tools to OpenAI schemas again, just
+# to switch the model. Agents created per request rather share one compiled graph (see agent_graph.py),
+# template.agent() only binds the (cached) tool schemas to the model:
+from agent_graph import AgentTemplate
+template = AgentTemplate(AgentState)
+abot = template.agent(cheap_model, [tool], system=prompt, metrics=metrics, verbose=True, escalate_to=strong_model)
+thread = {"configurable": {"thread_id": "super bowl"}}
 # executes sequentially (i.e. "Back to the model!" after each "Calling: ...")
 # because 2nd query needs result from 1st query):
-result = abot.graph.invoke({"messages": messages})
+result = abot.graph.invoke({"messages": messages}, thread)
+# Escalating to the strong model: multi-hop question
 # Calling: {'name': 'tavily_search_results_json', 'args': {'query': '2024 Super Bowl winner'}, 'id': 'call_kXCyYHUKnmBbp6PFT6Ig2X4H'}
 # Back to the model!
+# Escalating to the strong model: multi-hop question
 # Calling: {'name': 'tavily_search_results_json', 'args': {'query': 'Kansas City Chiefs headquarters location'}, 'id': 'call_CZfKWKxlGAeUyBhGfKpyugmJ'}
 # Calling: {'name': 'tavily_search_results_json', 'args': {'query': 'Missouri GDP 2023'}, 'id': 'call_IZpS3sgdzQYAjtVi70wEKsgK'}
 # Back to the model!
+# Escalating to the strong model: multi-hop question
 print(result['messages'][-1].content)
 # 1. **Who won the Super Bowl in 2024?**
 #    - The Kansas City Chiefs won the Super Bowl in 2024.
@@ -134,3 +168,19 @@ print(result['messages'][-1].content)
 #    - The Kansas City Chiefs are headquartered in Kansas City, Missouri.
 # 3. **What is the GDP of that state?**
 #    - In 2023, the Gross Domestic Product (GDP) of Missouri was approximately $430 billion.
+
+print(abot.router.log("super bowl"))
+# [{'ts': ..., 'model': 'strong', 'reason': 'multi-hop question'}, ... one entry per llm step]
+# simple lookups stay on the cheap model:
+result = abot.graph.invoke({"messages": [HumanMessage(content="What is the weather in sf?")]},
+                           {"configurable": {"thread_id": "weather"}})
+print(abot.router.log("weather"))
+# [{'ts': ..., 'model': 'cheap', 'reason': None}, {'ts': ..., 'model': 'cheap', 'reason': None}]
+
+print(metrics.totals())
+# e.g. {'node_runs': 5.0, 'node_seconds': 9.1, 'llm_calls': 3.0, 'llm_seconds': 5.2, 'prompt_tokens': 3310.0,
+#       'completion_tokens': 212.0, 'cached_tokens': 0.0, 'cost': 0.0104, 'tool_calls': 3.0, 'tool_seconds': 4.6, 'tool_errors': 0.0}
+print(metrics.by_node())
+# e.g. {'llm': {'runs': 3.0, 'seconds': 5.3, 'prompt_tokens': 3310.0, ...}, 'action': {'runs': 2.0, 'seconds': 3.8, 'tool_seconds': 4.6}}
+metrics.export_jsonl("lesson_2_metrics.jsonl")
+metrics.export_prometheus("lesson_2_metrics.prom")
@@ -1,12 +1,15 @@
 from dotenv import load_dotenv
 _ = load_dotenv()
+from cassette import use_cassette
+use_cassette()  # CASSETTE_MODE=record|replay records the OpenAI/Tavily traffic or serves it offline
 
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated
 import operator
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
+from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage
 from langchain_openai import ChatOpenAI 
 from langchain_community.tools.tavily_search import TavilySearchResults
+from agent_tools import run_tool_calls
 
 tool = TavilySearchResults(max_results=2) 
 
@@ -18,17 +21,25 @@ from langgraph.checkpoint.sqlite import SqliteSaver
 memory = SqliteSaver.from_conn_string(":memory:")
 
 class Agent:
-    def __init__(self, model, tools, checkpointer, system=""):
+    def __init__(self, model, tools, checkpointer, system="", metrics=None):
         self.system = system
+        # optional GraphMetrics, totals per thread_id (see graph_metrics.py)
+        self.metrics = metrics
         graph = StateGraph(AgentState)
-        graph.add_node("llm", self.call_openai)
-        graph.add_node("action", self.take_action)
+        if metrics is not None:
+            graph.add_node("llm", metrics.wrap_node("llm", self.call_openai))
+            graph.add_node("action", metrics.wrap_node("action", self.take_action))
+        else:
+            graph.add_node("llm", self.call_openai)
+            graph.add_node("action", self.take_action)
         graph.add_conditional_edges("llm", self.exists_action, {True: "action", False: END})
         graph.add_edge("action", "llm")
         graph.set_entry_point("llm")
         self.graph = graph.compile(checkpointer=checkpointer)
         self.tools = {t.name: t for t in tools}
         self.model = model.bind_tools(tools)
+        if metrics is not None:
+            self.model = metrics.instrument_model(self.model)
 
     def call_openai(self, state: AgentState):
         messages = state['messages']
@@ -43,11 +54,11 @@ class Agent:
 
     def take_action(self, state: AgentState):
         tool_calls = state['messages'][-1].tool_calls
-        results = []
         for t in tool_calls:
             print(f"Calling: {t}")
-            result = self.tools[t['name']].invoke(t['args'])
-            results.append(ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result)))
+        # concurrent tool calls with timeouts, results in tool_calls order,
+        # compacted before they enter the history (see agent_tools.py):
+        results = run_tool_calls(self.tools, tool_calls, compact=True, metrics=self.metrics)
         print("Back to the model!")
         return {'messages': results}
 
@@ -56,8 +67,16 @@ You are allowed to make multiple calls (either together or in sequence). \
 Only look up information when you are sure of what you want. \
 If you need to look up some information before asking a follow up question, you are allowed to do that!
 """
+# identical temperature-0 requests are answered from an on-disk cache (see response_cache.py;
+# enable_cache(sampled=True) caches sampled completions too), use `with response_cache.bypass():`
+# to force a fresh completion. Off (None) with RESPONSE_CACHE=off and while recording a cassette:
+from response_cache import enable_cache
+response_cache = enable_cache()
+
 model = ChatOpenAI(model="gpt-4o") # no longer gpt-3.5-turbo
-abot = Agent(model, [tool], system=prompt, checkpointer=memory)
+from graph_metrics import GraphMetrics
+metrics = GraphMetrics()
+abot = Agent(model, [tool], system=prompt, checkpointer=memory, metrics=metrics)
 
 messages = [HumanMessage(content="What is the weather in sf?")]
 
@@ -105,6 +124,14 @@ for event in abot.graph.stream({"messages": messages}, thread):
         print(v)
 # {'messages': [AIMessage(content='Could you please specify the two options or locations you are comparing in terms of warmth?', response_metadata={'token_usage': {'completion_tokens': 18, 'prompt_tokens': 149, 'total_tokens': 167, 'prompt_tokens_details': {'cached_tokens': 0, 'audio_tokens': 0}, 'completion_tokens_details': {'reasoning_tokens': 0, 'audio_tokens': 0, 'accepted_prediction_tokens': 0, 'rejected_prediction_tokens': 0}}, 'model_name': 'gpt-4o', 'system_fingerprint': 'fp_831e067d82', 'finish_reason': 'stop', 'logprobs': None}, id='run-ae8a51ae-77da-4360-89d9-a4b26730a0f4-0')]}
 
+# where did the tokens and seconds of each thread go? (cached_tokens: OpenAI's prompt caching,
+# e.g. 1280 of the 1431 prompt tokens of "Which one is warmer?" above)
+for thread_id in metrics.threads():
+    print(thread_id, metrics.totals(thread_id))
+print(metrics.by_node(thread_id="1"))
+metrics.export_jsonl("lesson_4_metrics.jsonl")
+metrics.export_prometheus("lesson_4_metrics.prom")
+
 # streaming tokens:
 
 from langgraph.checkpoint.aiosqlite import AsyncSqliteSaver
@@ -268,4 +295,19 @@ async for event in abot.graph.astream_events({"messages": messages}, thread, ver
 # Event on_chain_stream
 # Event on_chain_end
 # Event on_chain_stream
-# Event on_chain_end
\ No newline at end of file
+# Event on_chain_end
+# streaming tool dispatch: call_openai above only returns once the whole AIMessage with all its
+# tool_calls is there. With stream_tools=True the model's answer is streamed and every tool call
+# starts as soon as its JSON arguments are complete, while the model is still emitting the next
+# call (see ToolPrefetcher in agent_tools.py); the action step then only joins the results.
+# Not for graphs with interrupt_before=["action"], as the tools run before anyone can approve them.
+from agent_graph import AgentTemplate
+template = AgentTemplate(AgentState, checkpointer=memory)
+sbot = template.agent(model, [tool], system=prompt, stream_tools=True, verbose=True)
+messages = [HumanMessage(content="What is the weather in SF and LA?")]
+thread = {"configurable": {"thread_id": "6"}}
+async for event in sbot.graph.astream_events({"messages": messages}, thread, version="v1"):
+    if event["event"] == "on_chat_model_stream":
+        content = event["data"]["chunk"].content
+        if content:
+            print(content, end="|")
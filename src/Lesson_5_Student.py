@@ -8,8 +8,11 @@ from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, Too
 from langchain_openai import ChatOpenAI
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langgraph.checkpoint.sqlite import SqliteSaver
+from agent_tools import run_tool_calls
 
 _ = load_dotenv()
+from cassette import use_cassette
+use_cassette()  # CASSETTE_MODE=record|replay records the OpenAI/Tavily traffic or serves it offline
 memory = SqliteSaver.from_conn_string(":memory:")
 
 """
@@ -78,11 +81,11 @@ class Agent:
 
     def take_action(self, state: AgentState):
         tool_calls = state['messages'][-1].tool_calls
-        results = []
         for t in tool_calls:
             print(f"Calling: {t}")
-            result = self.tools[t['name']].invoke(t['args'])
-            results.append(ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result)))
+        # concurrent tool calls with timeouts, results in tool_calls order,
+        # compacted before they enter the history (see agent_tools.py):
+        results = run_tool_calls(self.tools, tool_calls, compact=True)
         print("Back to the model!")
         return {'messages': results}
 
@@ -91,6 +94,12 @@ You are allowed to make multiple calls (either together or in sequence). \
 Only look up information when you are sure of what you want. \
 If you need to look up some information before asking a follow up question, you are allowed to do that!
 """
+# identical temperature-0 requests are answered from an on-disk cache (see response_cache.py;
+# enable_cache(sampled=True) caches sampled completions too), use `with response_cache.bypass():`
+# to force a fresh completion. Off (None) with RESPONSE_CACHE=off and while recording a cassette:
+from response_cache import enable_cache
+response_cache = enable_cache()
+
 model = ChatOpenAI(model="gpt-3.5-turbo")
 abot = Agent(model, [tool], system=prompt, checkpointer=memory)
 messages = [HumanMessage(content="Whats the weather in SF?")]
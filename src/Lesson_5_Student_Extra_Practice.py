@@ -148,8 +148,9 @@ graph.invoke({"count":0, "scratch":"hi"},thread2)
 
 # {'lnode': 'node_2', 'scratch': 'hi', 'count': 4}
 
-from IPython.display import Image
-Image(graph.get_graph().draw_png())
+# renders in a notebook only (see graph_display.py):
+from graph_display import show_graph
+show_graph(graph)
 
 states2 = []
 for state in graph.get_state_history(thread2):
@@ -1,5 +1,7 @@
 from dotenv import load_dotenv
 _ = load_dotenv()
+from cassette import use_cassette
+use_cassette()  # CASSETTE_MODE=record|replay records the OpenAI/Tavily traffic or serves it offline
 
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Annotated, List
@@ -136,8 +138,9 @@ builder.add_edge("reflect", "research_critique")
 builder.add_edge("research_critique", "generate")
 graph = builder.compile(checkpointer=memory)
 
-from IPython.display import Image
-Image(graph.get_graph().draw_png())
+# renders in a notebook only (see graph_display.py):
+from graph_display import show_graph
+show_graph(graph)
 
 thread = {"configurable": {"thread_id": "1"}}
 for s in graph.stream({
@@ -165,6 +168,15 @@ import warnings
 warnings.filterwarnings("ignore")
 from helper import ewriter, writer_gui
 
-MultiAgent = ewriter()
+# the essays of the GUI survive a restart with a file-backed checkpointer (see sqlite_checkpointer.py):
+# WAL mode, one writer and a pool of readers for the Gradio worker threads
+from sqlite_checkpointer import PooledSqliteSaver, RetentionPolicy
+checkpointer = PooledSqliteSaver(os.path.join(os.path.dirname(os.path.abspath(__file__)), "essays.sqlite"))
+# and the history dropdown doesn't grow forever: every 10 minutes, keep the last 100 states of an
+# essay (plus branch points and manual edits), delete essays untouched for 30 days. The states the
+# graph stopped at are not pinned (no interrupt_nodes): ewriter interrupts after every node, so
+# pinning MultiAgent.graph.interrupt_after_nodes would keep every state of every essay
+checkpointer.start_retention(RetentionPolicy(keep_last=100, idle_ttl=30 * 86400), interval=600)
+MultiAgent = ewriter(checkpointer=checkpointer)
 app = writer_gui(MultiAgent.graph)
 app.launch()
\ No newline at end of file
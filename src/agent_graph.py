@@ -0,0 +1,378 @@
+# compile-once graph for the llm/action research agent of Lessons 2, 4 and 5
+#
+# Agent.__init__ builds a StateGraph, compiles it, converts the tools to OpenAI schemas in
+# model.bind_tools() and builds the tool dict, for every agent. An AgentTemplate compiles the
+# graph once; its nodes look up model, tools and system prompt of the agent in
+# config["configurable"]["agent"], so template.agent(model, tools, system) is cheap:
+#
+#   template = AgentTemplate()
+#   abot = template.agent(ChatOpenAI(model="gpt-4o"), [tool], system=prompt)
+#   abot.graph.invoke({"messages": messages}, thread)
+from collections import OrderedDict, defaultdict, deque
+from typing import TypedDict, Annotated
+import contextlib
+import re
+import threading
+import time
+
+from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage, message_chunk_to_message
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.graph import StateGraph, END
+
+from agent_tools import ToolPrefetcher, run_tool_calls
+from message_log import append_messages, with_system
+
+
+class AgentState(TypedDict):
+    messages: Annotated[list[AnyMessage], append_messages]
+
+
+# tool set (tuple of tool ids) -> (tools, {name: tool}, OpenAI schemas), only the last
+# MAX_TOOL_SETS are kept; an entry is only used if it holds the very same tool objects,
+# so an id reused by another tool after the original was collected can't match
+MAX_TOOL_SETS = 128
+_tool_sets = OrderedDict()
+_tool_sets_lock = threading.Lock()
+
+
+def tool_set(tools):
+    """{name: tool} and OpenAI schemas of tools, converted once per tool set"""
+    tools = list(tools)
+    key = tuple(id(t) for t in tools)
+    with _tool_sets_lock:
+        entry = _tool_sets.get(key)
+        if entry is not None and all(a is b for a, b in zip(entry[0], tools)):
+            _tool_sets.move_to_end(key)
+            return entry[1], entry[2]
+    entry = (tools, {t.name: t for t in tools}, [convert_to_openai_tool(t) for t in tools])
+    with _tool_sets_lock:
+        _tool_sets[key] = entry
+        _tool_sets.move_to_end(key)
+        while len(_tool_sets) > MAX_TOOL_SETS:
+            _tool_sets.popitem(last=False)
+    return entry[1], entry[2]
+
+
+class AgentSpec:
+    """What distinguishes one agent from another one built from the same template"""
+    __slots__ = ("model", "tools", "system", "metrics", "compact", "verbose", "router", "stream_tools")
+
+    def __init__(self, model, tools, system="", metrics=None, compact=True, verbose=False, escalate_to=None,
+                 stream_tools=False):
+        if stream_tools and escalate_to is not None:
+            raise ValueError("stream_tools would start the tool calls of answers the cascade may throw away")
+        self.tools, schemas = tool_set(tools)
+        self.model = model.bind(tools=schemas) if tools else model
+        if metrics is not None:
+            self.model = metrics.instrument_model(self.model)
+        self.router = None
+        if escalate_to is not None:
+            strong = escalate_to.bind(tools=schemas) if tools else escalate_to
+            if metrics is not None:
+                strong = metrics.instrument_model(strong)
+            self.router = CascadeRouter(self.model, strong, self.tools, metrics=metrics, verbose=verbose)
+        self.system = SystemMessage(content=system) if system else None
+        self.metrics = metrics
+        self.compact = compact
+        self.verbose = verbose
+        self.stream_tools = stream_tools
+
+
+def _spec(config):
+    try:
+        return config["configurable"]["agent"]
+    except (KeyError, TypeError):
+        raise ValueError("no agent in config, use template.agent(...).graph instead of template.graph") from None
+
+
+# futures of tool calls started while the model was streaming, by tool_call id, until the action
+# step joins them (only the last MAX_PREFETCHED are kept, e.g. if a thread never gets there)
+MAX_PREFETCHED = 1000
+_prefetched = OrderedDict()
+_prefetched_lock = threading.Lock()
+
+
+def _stream_with_tools(spec, messages, config):
+    prefetcher = ToolPrefetcher(spec.tools)
+    message = None
+    # the node's config carries the callbacks, so the streamed call is traced like model.invoke
+    for chunk in spec.model.stream(messages, config):
+        prefetcher.feed(chunk)
+        message = chunk if message is None else message + chunk
+    prefetcher.close()
+    with _prefetched_lock:
+        _prefetched.update(prefetcher.futures())
+        while len(_prefetched) > MAX_PREFETCHED:
+            _prefetched.popitem(last=False)
+    return message_chunk_to_message(message)
+
+
+def _pop_prefetched(tool_calls):
+    with _prefetched_lock:
+        return {t['id']: _prefetched.pop(t['id']) for t in tool_calls if t['id'] in _prefetched}
+
+
+def _node(spec, name, config):
+    return spec.metrics.node(name, config) if spec.metrics is not None else contextlib.nullcontext()
+
+
+class AgentTemplate:
+    """The llm/action graph, compiled once and shared by all agents built with agent()"""
+
+    def __init__(self, state=AgentState, checkpointer=None, interrupt_before=None, interrupt_after=None):
+        self.interrupt_before = interrupt_before or []
+        graph = StateGraph(state)
+        graph.add_node("llm", self.call_openai)
+        graph.add_node("action", self.take_action)
+        graph.add_conditional_edges("llm", self.exists_action, {True: "action", False: END})
+        graph.add_edge("action", "llm")
+        graph.set_entry_point("llm")
+        self.graph = graph.compile(checkpointer=checkpointer, interrupt_before=interrupt_before,
+                                   interrupt_after=interrupt_after)
+
+    def agent(self, model, tools, system="", metrics=None, compact=True, verbose=False, escalate_to=None,
+              stream_tools=False):
+        """An agent using this template's graph, with its own model, tools and system prompt
+
+        verbose=True prints the tool calls like the lessons' Agent does. With escalate_to
+        (a stronger model) every step goes to model first and is escalated by a CascadeRouter.
+        With stream_tools=True the model's answer is streamed and each tool call starts as soon
+        as its arguments are complete (see ToolPrefetcher), not possible with interrupt_before=["action"].
+        """
+        if stream_tools and "action" in self.interrupt_before:
+            raise ValueError("stream_tools would run the tools before the interrupt before 'action'")
+        return TemplateAgent(self, AgentSpec(model, tools, system, metrics, compact, verbose, escalate_to,
+                                             stream_tools))
+
+    @staticmethod
+    def call_openai(state, config):
+        spec = _spec(config)
+        with _node(spec, "llm", config):
+            messages = state['messages']
+            if spec.system is not None:
+                messages = with_system(spec.system, messages)
+            if spec.router is not None:
+                message = spec.router.invoke(state['messages'], messages, config)
+            elif spec.stream_tools:
+                message = _stream_with_tools(spec, messages, config)
+            else:
+                message = spec.model.invoke(messages, config)
+        return {'messages': [message]}
+
+    @staticmethod
+    def exists_action(state):
+        result = state['messages'][-1]
+        return len(getattr(result, "tool_calls", None) or []) > 0
+
+    @staticmethod
+    def take_action(state, config):
+        spec = _spec(config)
+        tool_calls = state['messages'][-1].tool_calls
+        if spec.verbose:
+            for t in tool_calls:
+                print(f"Calling: {t}")
+        with _node(spec, "action", config):
+            results = run_tool_calls(spec.tools, tool_calls, compact=spec.compact, metrics=spec.metrics,
+                                     prefetched=_pop_prefetched(tool_calls))
+        if spec.verbose:
+            print("Back to the model!")
+        return {'messages': results}
+
+
+class BoundGraph:
+    """The template's compiled graph with one agent's spec added to every config"""
+
+    def __init__(self, graph, spec):
+        self._graph = graph
+        self._spec = spec
+
+    def _config(self, config):
+        config = dict(config or {})
+        config["configurable"] = dict(config.get("configurable") or {}, agent=self._spec)
+        return config
+
+    def invoke(self, input, config=None, **kwargs):
+        return self._graph.invoke(input, self._config(config), **kwargs)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self._graph.ainvoke(input, self._config(config), **kwargs)
+
+    def stream(self, input, config=None, **kwargs):
+        return self._graph.stream(input, self._config(config), **kwargs)
+
+    def astream(self, input, config=None, **kwargs):
+        return self._graph.astream(input, self._config(config), **kwargs)
+
+    def astream_events(self, input, config=None, **kwargs):
+        return self._graph.astream_events(input, self._config(config), **kwargs)
+
+    def __getattr__(self, name):
+        # get_state, update_state, get_state_history, get_graph, ...
+        return getattr(self._graph, name)
+
+
+class TemplateAgent:
+    """Same attributes as the lessons' Agent: graph, model, tools, system"""
+
+    def __init__(self, template, spec):
+        self.template = template
+        self.spec = spec
+        self.graph = BoundGraph(template.graph, spec)
+
+    @property
+    def model(self):
+        return self.spec.model
+
+    @property
+    def tools(self):
+        return self.spec.tools
+
+    @property
+    def system(self):
+        return self.spec.system.content if self.spec.system is not None else ""
+
+    @property
+    def router(self):
+        return self.spec.router
+
+
+# questions that need several dependent lookups ("Who won ...? In what state ...? What is the GDP
+# of that state?") or a comparison; the cheap model tends to stop after the first hop
+MULTI_HOP_PATTERNS = [
+    r"\?[^?]+\?",
+    r"\b(of|in|for) (that|this|the same) (state|city|country|team|company|person|year)\b",
+    r"\b(compare|comparison|versus|vs\.?|difference between)\b",
+    r"\b(step by step|explain why)\b",
+]
+# the model saying that it isn't confident
+LOW_CONFIDENCE_PATTERNS = [
+    r"\b(i'?m|i am) not (sure|certain)\b",
+    r"\bi (don'?t|do not) know\b",
+    r"\b(unable|not able) to (find|determine|answer)\b",
+    r"\bcannot (find|determine|answer)\b",
+    r"\bnot enough information\b",
+]
+
+
+class CascadeRouter:
+    """Answers every step with the cheap model and escalates it to the strong model only when needed
+
+    Straight to the strong model: the question of the current turn looks multi-hop
+    (MULTI_HOP_PATTERNS), or a tool call of this turn already failed. Escalated after the
+    cheap answer: malformed tool calls or unknown tool names, an empty answer, or an answer
+    matching LOW_CONFIDENCE_PATTERNS. Every decision is logged per thread_id, see log().
+    """
+
+    def __init__(self, cheap, strong, tools, metrics=None, verbose=False, log_size=1000):
+        self.cheap = cheap
+        self.strong = strong
+        self.tools = tools
+        self.metrics = metrics
+        self.verbose = verbose
+        self.multi_hop = re.compile("|".join(MULTI_HOP_PATTERNS), re.IGNORECASE | re.DOTALL)
+        self.low_confidence = re.compile("|".join(LOW_CONFIDENCE_PATTERNS), re.IGNORECASE)
+        self.decisions = defaultdict(lambda: deque(maxlen=log_size))
+
+    def before(self, history):
+        """Reason to skip the cheap model for this step, or None"""
+        for m in reversed(history):
+            if isinstance(m, HumanMessage):
+                if isinstance(m.content, str) and self.multi_hop.search(m.content):
+                    return "multi-hop question"
+                return None
+            if isinstance(m, ToolMessage) and (m.status == "error" or isinstance(m.content, str)
+                                               and m.content.startswith(("error:", "bad tool name"))):
+                return "failed tool call"
+        return None
+
+    def after(self, message):
+        """Reason to escalate the cheap model's answer, or None"""
+        if getattr(message, "invalid_tool_calls", None):
+            return "malformed tool call"
+        tool_calls = getattr(message, "tool_calls", None) or []
+        if any(t['name'] not in self.tools for t in tool_calls):
+            return "unknown tool"
+        if tool_calls:
+            return None
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        if not content.strip():
+            return "empty answer"
+        if self.low_confidence.search(content):
+            return "low confidence"
+        return None
+
+    def invoke(self, history, messages, config=None):
+        """history: the state's messages, messages: what is sent to the model (with the system prompt)"""
+        reason = self.before(history)
+        if reason is None:
+            message = self.cheap.invoke(messages, config)
+            reason = self.after(message)
+            if reason is None:
+                self._log(config, "cheap", None)
+                return message
+        self._log(config, "strong", reason)
+        return self.strong.invoke(messages, config)
+
+    def _log(self, config, model, reason):
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        self.decisions[thread_id].append({"ts": time.time(), "model": model, "reason": reason})
+        if self.metrics is not None:
+            self.metrics.record("route", model=model, reason=reason)
+        if self.verbose and reason is not None:
+            print(f"Escalating to the strong model: {reason}")
+
+    def log(self, thread_id=None):
+        """Routing decisions of a thread, oldest first"""
+        return list(self.decisions[thread_id])
+
+    def escalation_rate(self, thread_id=None):
+        threads = [thread_id] if thread_id is not None else list(self.decisions)
+        decisions = [d for t in threads for d in self.decisions[t]]
+        return sum(d["model"] == "strong" for d in decisions) / len(decisions) if decisions else 0.0
+
+
+def benchmark(n=200):
+    """Construction cost per agent: Agent-style (new graph, compile, bind_tools) vs AgentTemplate.agent()"""
+    from langchain_core.tools import tool
+    from langchain_openai import ChatOpenAI
+
+    @tool
+    def search(query: str) -> str:
+        """Search the web for query"""
+        return query
+
+    @tool
+    def weather(city: str, unit: str = "celsius") -> str:
+        """Current weather in city"""
+        return city
+
+    tools = [search, weather]
+    models = [ChatOpenAI(model=name, api_key="benchmark") for name in ("gpt-3.5-turbo", "gpt-4o")]
+
+    def per_agent():
+        graph = StateGraph(AgentState)
+        graph.add_node("llm", AgentTemplate.call_openai)
+        graph.add_node("action", AgentTemplate.take_action)
+        graph.add_conditional_edges("llm", AgentTemplate.exists_action, {True: "action", False: END})
+        graph.add_edge("action", "llm")
+        graph.set_entry_point("llm")
+        return graph.compile(), {t.name: t for t in tools}, models[i % 2].bind_tools(tools)
+
+    start = time.perf_counter()
+    for i in range(n):
+        per_agent()
+    before = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    template = AgentTemplate()
+    compile_once = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(n):
+        template.agent(models[i % 2], tools, system="You are a smart research assistant.")
+    after = (time.perf_counter() - start) / n
+    print("per-agent graph + compile + bind_tools {:8.3f} ms per agent".format(before * 1000))
+    print("AgentTemplate.agent()                  {:8.3f} ms per agent (+ {:.1f} ms once for the template)".format(
+        after * 1000, compile_once * 1000))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,201 @@
+# tool execution for the LangGraph agents of Lessons 2, 4 and 5
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import json
+import threading
+import time
+
+from langchain_core.messages import ToolMessage
+
+from context_window import count_tokens
+from tavily_records import TavilyResponse, Weather
+
+# shared by all agents, so the threads are reused from step to step:
+MAX_WORKERS = 16
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="tool")
+_pool_lock = threading.Lock()
+_stuck = set()  # futures of timed-out calls that still occupy a worker
+
+
+def _submit(fn, args):
+    with _pool_lock:
+        return _pool.submit(_timed, fn, args)
+
+
+def _abandon(future):
+    """Give up on a timed-out call; once half the workers hang in such calls, new calls get a fresh pool"""
+    global _pool
+    if future.cancel():  # never started
+        return
+    with _pool_lock:
+        _stuck.add(future)
+        future.add_done_callback(_stuck.discard)
+        if len(_stuck) >= MAX_WORKERS // 2:
+            # the stuck threads can't be stopped, they end (and the old pool with them) when their calls return:
+            _pool.shutdown(wait=False)
+            _pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="tool")
+            _stuck.clear()
+
+
+def _timed(fn, args):
+    start = time.monotonic()
+    result = fn(args)
+    return result, time.monotonic() - start
+
+
+def run_tool_calls(tools, tool_calls, timeout=30, compact=False, max_tokens=400, metrics=None, prefetched=None):
+    """Run the tool calls of one AIMessage concurrently, return their ToolMessages in tool_calls order
+
+    tools maps tool names to tools. A bad tool name, a failing tool or one that takes longer
+    than timeout seconds becomes a ToolMessage with status="error" (so the model can retry) instead of
+    aborting the step. The step takes as long as the slowest call, not the sum of all calls.
+    With compact=True results go through compact_result() before they enter the history,
+    the raw results stay available through get_raw_result(tool_call_id).
+    The time of every call is recorded in metrics (a GraphMetrics), if given.
+    Calls already started by a ToolPrefetcher (prefetched maps tool_call ids to its futures)
+    are joined instead of being run again.
+    """
+    prefetched = prefetched or {}
+    futures = [prefetched.get(t['id']) or _submit(tools[t['name']].invoke, t['args'])
+               if t['name'] in tools else None
+               for t in tool_calls]
+    deadline = time.monotonic() + timeout
+    results = []
+    for t, future in zip(tool_calls, futures):
+        status = "error"
+        if future is None:
+            print("\n ....bad tool name....")
+            # instruct LLM to retry if bad:
+            content = "bad tool name, retry"
+        else:
+            try:
+                result, seconds = future.result(timeout=max(0, deadline - time.monotonic()))
+                if metrics is not None:
+                    metrics.record("tool", tool=t['name'], seconds=seconds, error=None)
+                if compact:
+                    _keep_raw_result(t['id'], result)
+                    content = compact_result(t['name'], result, max_tokens=max_tokens)
+                else:
+                    content = str(result)
+                status = "success"
+            except FutureTimeoutError:
+                # the thread can't be stopped, but its late result is ignored:
+                _abandon(future)
+                content = "error: {} timed out after {}s, retry".format(t['name'], timeout)
+                if metrics is not None:
+                    metrics.record("tool", tool=t['name'], seconds=timeout, error="timeout")
+            except Exception as e:
+                if metrics is not None:
+                    metrics.record("tool", tool=t['name'], seconds=None, error=repr(e))
+                content = "error: {} failed: {!r}, retry".format(t['name'], e)
+        results.append(ToolMessage(tool_call_id=t['id'], name=t['name'], content=content, status=status))
+    return results
+
+
+class ToolPrefetcher:
+    """Starts the tool calls of an AIMessage while the model is still streaming it
+
+    feed() every AIMessageChunk; a call is submitted as soon as its JSON arguments are
+    complete, while the model keeps emitting the remaining calls. Pass futures() as
+    run_tool_calls(prefetched=...) to join them in the action step. The tools run before
+    anyone can look at the calls, so don't use this where tool calls need approval
+    (interrupt_before=["action"]).
+    """
+
+    def __init__(self, tools):
+        self.tools = tools
+        self.calls = {}      # index in the message -> {"name", "id", "args"}
+        self._futures = {}   # tool_call id -> future of (result, seconds)
+
+    def feed(self, chunk):
+        for c in getattr(chunk, "tool_call_chunks", None) or []:
+            call = self.calls.setdefault(c.get("index") or 0, {"name": "", "id": None, "args": ""})
+            if c.get("name"):
+                call["name"] += c["name"]
+            if c.get("id"):
+                call["id"] = c["id"]
+            if c.get("args"):
+                call["args"] += c["args"]
+                # a JSON object can only parse once its closing brace has arrived:
+                if call["args"].rstrip().endswith("}"):
+                    self._start(call)
+
+    def _start(self, call):
+        if call["id"] is None or call["id"] in self._futures or call["name"] not in self.tools:
+            return
+        try:
+            args = json.loads(call["args"]) if call["args"].strip() else {}
+        except ValueError:
+            return
+        self._futures[call["id"]] = _submit(self.tools[call["name"]].invoke, args)
+
+    def close(self):
+        """The stream has ended: start the calls that are still waiting (e.g. without arguments)"""
+        for call in self.calls.values():
+            self._start(call)
+
+    def futures(self):
+        return dict(self._futures)
+
+
+# raw tool results by tool_call_id, kept out of the message history (for debugging):
+MAX_RAW_RESULTS = 1000
+_raw_results = OrderedDict()
+_raw_lock = threading.Lock()
+
+
+def _keep_raw_result(tool_call_id, result):
+    with _raw_lock:
+        _raw_results[tool_call_id] = result
+        while len(_raw_results) > MAX_RAW_RESULTS:
+            _raw_results.popitem(last=False)
+
+
+def get_raw_result(tool_call_id):
+    """The uncompacted result of a tool call (only the last MAX_RAW_RESULTS are kept)"""
+    with _raw_lock:
+        return _raw_results.get(tool_call_id)
+
+
+# tool name -> function(result) returning the compact text for the history
+COMPACTORS = {}
+
+
+def register_compactor(tool_name):
+    """Decorator registering the compactor for the results of one tool"""
+    def decorator(fn):
+        COMPACTORS[tool_name] = fn
+        return fn
+    return decorator
+
+
+def truncate_tokens(text, max_tokens):
+    if max_tokens <= 0:  # even "" counts as a token with the estimate, the loop below would never end
+        return ""
+    n = count_tokens(text)
+    while n > max_tokens:
+        text = text[:int(len(text) * max_tokens / n * 0.95)]
+        n = count_tokens(text)
+    return text
+
+
+def compact_result(tool_name, result, max_tokens=400):
+    """Only the relevant part of a tool result, cut to max_tokens"""
+    compactor = COMPACTORS.get(tool_name)
+    text = compactor(result) if compactor else str(result)
+    if count_tokens(text) > max_tokens:
+        text = truncate_tokens(text, max_tokens) + " ..."
+    return text
+
+
+def compact_weather(weather):
+    return Weather(weather).to_text()
+
+
+@register_compactor("tavily_search_results_json")
+def compact_tavily_results(results, max_chars=600):
+    """One line per result: weather payloads condensed, other pages whitespace-collapsed and cut,
+    duplicate URLs and contents dropped (decoded and rendered once, see tavily_records.py)"""
+    if not isinstance(results, list):
+        return str(results)
+    return TavilyResponse.parse(results).to_text(max_chars)
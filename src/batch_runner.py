@@ -0,0 +1,191 @@
+# asyncio batch driver for the ReAct loop of Lesson 1, e.g. for nightly evaluation runs
+# with tens of thousands of questions
+import asyncio
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+from context_window import count_tokens, MESSAGE_OVERHEAD
+from react_helper import parse_actions, format_observation
+
+
+def make_client(concurrency=16, timeout=60.0):
+    """One AsyncOpenAI client for the whole batch, on a pooled keep-alive HTTP connection pool"""
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        timeout=timeout)
+    return AsyncOpenAI(http_client=http_client)
+
+
+class RateLimiter:
+    """Token buckets for requests per minute and tokens per minute"""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.tpm)
+        # one waiter at a time, so requests are served in order:
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep(max((1 - self.requests) * 60 / self.rpm,
+                                        (tokens - self.tokens) * 60 / self.tpm,
+                                        0.001))
+
+    def settle(self, estimated, actual):
+        """Correct the estimate made in acquire() by the usage the API reported"""
+        self.tokens -= actual - estimated
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class BatchStats:
+    """Throughput and latency of one run_queries() batch"""
+
+    def __init__(self):
+        self.started = None
+        self.finished = None
+        self.latencies = []
+        self.errors = 0
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, result):
+        self.latencies.append(result["latency"])
+        self.errors += result["error"] is not None
+        self.turns += result["turns"]
+        self.prompt_tokens += result["prompt_tokens"]
+        self.completion_tokens += result["completion_tokens"]
+
+    def report(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        latencies = sorted(self.latencies)
+        return {
+            "questions": len(latencies),
+            "errors": self.errors,
+            "seconds": round(elapsed, 2),
+            "questions_per_second": round(len(latencies) / elapsed, 2) if elapsed else None,
+            "llm_turns": self.turns,
+            "p50_latency": _percentile(latencies, 0.50),
+            "p95_latency": _percentile(latencies, 0.95),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+async def _run_action(known_actions, action, action_input, timeout):
+    if action not in known_actions:
+        raise Exception("Unknown action: {}: {}".format(action, action_input))
+    try:
+        # the actions are plain (blocking) functions, run them on the default thread pool:
+        observation = await asyncio.wait_for(asyncio.to_thread(known_actions[action], action_input), timeout)
+    except asyncio.TimeoutError:
+        observation = "timed out after {}s".format(timeout)
+    except Exception as e:
+        observation = "error: {}".format(e)
+    return action, action_input, observation
+
+
+async def _run_question(client, limiter, index, question, system, known_actions,
+                        model, max_turns, max_tokens, action_timeout):
+    start = time.monotonic()
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": question}]
+    # prompt size is tracked incrementally, every message is counted once:
+    prompt_estimate = sum(count_tokens(m["content"], model) + MESSAGE_OVERHEAD for m in messages)
+    result = {"index": index, "question": question, "answer": None, "error": None,
+              "turns": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    try:
+        while result["turns"] < max_turns:
+            result["turns"] += 1
+            estimate = prompt_estimate + max_tokens
+            await limiter.acquire(estimate)
+            completion = await client.chat.completions.create(
+                model=model, temperature=0, messages=messages, max_tokens=max_tokens)
+            if completion.usage:
+                limiter.settle(estimate, completion.usage.total_tokens)
+                result["prompt_tokens"] += completion.usage.prompt_tokens
+                result["completion_tokens"] += completion.usage.completion_tokens
+            content = completion.choices[0].message.content or ""
+            messages.append({"role": "assistant", "content": content})
+            prompt_estimate += count_tokens(content, model) + MESSAGE_OVERHEAD
+            actions = parse_actions(content)
+            if not actions:
+                result["answer"] = content.split("Answer:", 1)[-1].strip()
+                break
+            # all actions of one turn run concurrently:
+            observations = await asyncio.gather(
+                *(_run_action(known_actions, a, i, action_timeout) for a, i in actions))
+            observation = format_observation(observations)
+            messages.append({"role": "user", "content": observation})
+            prompt_estimate += count_tokens(observation, model) + MESSAGE_OVERHEAD
+    except Exception as e:
+        result["error"] = repr(e)
+    result["latency"] = time.monotonic() - start
+    return result
+
+
+async def run_queries(questions, system, known_actions, concurrency=16, rpm=500, tpm=200_000,
+                      model="gpt-4o", max_turns=5, max_tokens=512, action_timeout=10,
+                      client=None, stats=None):
+    """Run every question through the ReAct loop, yield result dicts as soon as each question is done
+
+    Results come in completion order, result["index"] is the position in `questions`.
+    Pass a BatchStats to get throughput and p50/p95 latency afterwards.
+    """
+    own_client = client is None
+    if own_client:
+        client = make_client(concurrency)
+    limiter = RateLimiter(rpm, tpm)
+    stats = stats if stats is not None else BatchStats()
+    stats.started = time.monotonic()
+    queue = asyncio.Queue()
+    pending = iter(enumerate(questions))
+
+    async def worker():
+        # the workers share one iterator, so every question is taken exactly once
+        # and no more than `concurrency` questions are in flight:
+        for index, question in pending:
+            result = await _run_question(client, limiter, index, question, system, known_actions,
+                                         model, max_turns, max_tokens, action_timeout)
+            stats.add(result)
+            await queue.put(result)
+        await queue.put(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        running = len(workers)
+        while running:
+            result = await queue.get()
+            if result is None:
+                running -= 1
+            else:
+                yield result
+    finally:
+        for w in workers:
+            w.cancel()
+        stats.finished = time.monotonic()
+        if own_client:
+            await client.close()
@@ -0,0 +1,244 @@
+# record/replay of the OpenAI and Tavily traffic of the lesson agents, so that the graphs can be
+# benchmarked and profiled offline and deterministically, without network noise:
+#
+#   CASSETTE_MODE=record python Lesson_2_Student.py                       -> cassettes/lesson_2.jsonl.gz
+#   CASSETTE_MODE=replay CASSETTE_LATENCY=0.3 python Lesson_2_Student.py  -> no network needed
+#
+# Recording happens at the HTTP layer: httpx (OpenAI client, ChatOpenAI) and requests
+# (TavilyClient.search, TavilySearchResults). Only hosts in HOSTS are recorded, everything
+# else (e.g. gradio) passes through. aiohttp (async Tavily calls) is not covered.
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+CASSETTE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes")
+HOSTS = ("api.openai.com", "api.tavily.com")
+_SECRET_FIELDS = ("api_key",)  # Tavily sends its key in the JSON body
+# bodies are stored decoded, so these headers would be wrong on replay:
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie", "connection"}
+
+
+class CassetteMiss(KeyError):
+    pass
+
+
+def request_key(method, url, body):
+    """Hash of method, URL and body of a request (JSON bodies normalized, API keys removed)"""
+    if body:
+        try:
+            data = json.loads(body)
+            if isinstance(data, dict):
+                for field in _SECRET_FIELDS:
+                    data.pop(field, None)
+            body = json.dumps(data, sort_keys=True, separators=(",", ":"))
+        except (ValueError, UnicodeDecodeError):
+            pass
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    digest = hashlib.sha256("{} {}\n".format(method.upper(), url).encode("utf-8"))
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+class Cassette:
+    """Recorded HTTP interactions, mode is "record" or "replay"
+
+    latency: seconds added to every replayed response, or "recorded" to wait as long as
+    the original request took. Identical requests are replayed in recording order
+    (the last response is repeated when they run out).
+    """
+
+    def __init__(self, path, mode="replay", latency=0.0, hosts=HOSTS):
+        if mode not in ("record", "replay"):
+            raise ValueError("mode must be 'record' or 'replay', not {!r}".format(mode))
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.hosts = hosts
+        self.lock = threading.Lock()
+        self.entries = []                      # recorded interactions, in order
+        self.responses = defaultdict(list)     # key -> entries
+        self.replayed = defaultdict(int)       # key -> number of times replayed
+        self.originals = {}
+        if mode == "replay":
+            self.load()
+
+    def load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                self.entries.append(entry)
+                self.responses[entry["key"]].append(entry)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def matches(self, url):
+        return urlsplit(url).hostname in self.hosts
+
+    def record(self, method, url, body, status, headers, content, elapsed):
+        entry = {"key": request_key(method, url, body), "method": method, "url": url, "status": status,
+                 "headers": {k: v for k, v in headers.items() if k.lower() not in _DROP_HEADERS},
+                 "elapsed": round(elapsed, 4)}
+        try:
+            entry["body"] = content.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(content).decode("ascii")
+        with self.lock:
+            self.entries.append(entry)
+
+    def lookup(self, method, url, body):
+        key = request_key(method, url, body)
+        with self.lock:
+            entries = self.responses.get(key)
+            if not entries:
+                raise CassetteMiss("no recorded response for {} {} in {}".format(method, url, self.path))
+            i = self.replayed[key]
+            self.replayed[key] += 1
+        entry = entries[min(i, len(entries) - 1)]
+        content = base64.b64decode(entry["body_b64"]) if "body_b64" in entry else entry["body"].encode("utf-8")
+        return entry, content
+
+    def delay(self, entry):
+        return entry["elapsed"] if self.latency == "recorded" else float(self.latency)
+
+    def install(self):
+        """Patch httpx and requests so that matching requests are recorded or replayed"""
+        cassette = self
+        try:
+            import httpx
+        except ImportError:
+            httpx = None
+        try:
+            import requests.adapters
+        except ImportError:
+            requests = None
+
+        if httpx is not None:
+            send = self.originals[(httpx.Client, "send")] = httpx.Client.send
+            asend = self.originals[(httpx.AsyncClient, "send")] = httpx.AsyncClient.send
+
+            def httpx_send(client, request, **kwargs):
+                url = str(request.url)
+                if not cassette.matches(url):
+                    return send(client, request, **kwargs)
+                if cassette.mode == "replay":
+                    entry, content = cassette.lookup(request.method, url, request.read())
+                    time.sleep(cassette.delay(entry))
+                    return httpx.Response(entry["status"], headers=entry["headers"], content=content,
+                                          request=request)
+                start = time.monotonic()
+                response = send(client, request, **kwargs)
+                response.read()
+                cassette.record(request.method, url, request.content, response.status_code,
+                                response.headers, response.content, time.monotonic() - start)
+                return response
+
+            async def httpx_asend(client, request, **kwargs):
+                import asyncio
+                url = str(request.url)
+                if not cassette.matches(url):
+                    return await asend(client, request, **kwargs)
+                if cassette.mode == "replay":
+                    entry, content = cassette.lookup(request.method, url, await request.aread())
+                    await asyncio.sleep(cassette.delay(entry))
+                    return httpx.Response(entry["status"], headers=entry["headers"], content=content,
+                                          request=request)
+                start = time.monotonic()
+                response = await asend(client, request, **kwargs)
+                await response.aread()
+                cassette.record(request.method, url, request.content, response.status_code,
+                                response.headers, response.content, time.monotonic() - start)
+                return response
+
+            httpx.Client.send = httpx_send
+            httpx.AsyncClient.send = httpx_asend
+
+        if requests is not None:
+            HTTPAdapter = requests.adapters.HTTPAdapter
+            adapter_send = self.originals[(HTTPAdapter, "send")] = HTTPAdapter.send
+
+            def requests_send(adapter, request, *args, **kwargs):
+                if not cassette.matches(request.url):
+                    return adapter_send(adapter, request, *args, **kwargs)
+                if cassette.mode == "replay":
+                    entry, content = cassette.lookup(request.method, request.url, request.body)
+                    time.sleep(cassette.delay(entry))
+                    return _requests_response(entry, content, request)
+                start = time.monotonic()
+                response = adapter_send(adapter, request, *args, **kwargs)
+                cassette.record(request.method, request.url, request.body, response.status_code,
+                                response.headers, response.content, time.monotonic() - start)
+                return response
+
+            HTTPAdapter.send = requests_send
+
+    def uninstall(self):
+        for (cls, name), original in self.originals.items():
+            setattr(cls, name, original)
+        self.originals = {}
+        if self.mode == "record":
+            self.save()
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+
+def _requests_response(entry, content, request):
+    from requests.models import Response
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+    response = Response()
+    response.status_code = entry["status"]
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response._content = content
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = request.url
+    response.request = request
+    response.reason = "OK" if entry["status"] < 400 else "Error"
+    return response
+
+
+def _caller_name(depth=2):
+    # Lesson_2_Student.py -> lesson_2
+    path = sys._getframe(depth).f_globals.get("__file__") or "interactive"
+    name = os.path.splitext(os.path.basename(path))[0].lower()
+    return name[:-len("_student")] if name.endswith("_student") else name
+
+
+def use_cassette(name=None, mode=None, latency=None):
+    """Record or replay the traffic of a lesson script, depending on CASSETTE_MODE (record, replay, default off)
+
+    Call it before the clients are created; name defaults to the calling script (lesson_2 for Lesson_2_Student.py).
+    """
+    mode = mode or os.getenv("CASSETTE_MODE", "off")
+    if mode == "off":
+        return None
+    if name is None:
+        name = _caller_name()
+    if latency is None:
+        latency = os.getenv("CASSETTE_LATENCY", "0")
+        latency = latency if latency == "recorded" else float(latency)
+    if mode == "replay":
+        # the clients refuse to start without keys, which are not needed offline:
+        os.environ.setdefault("OPENAI_API_KEY", "replay")
+        os.environ.setdefault("TAVILY_API_KEY", "replay")
+    cassette = Cassette(os.path.join(CASSETTE_DIR, name + ".jsonl.gz"), mode=mode, latency=latency)
+    cassette.install()
+    atexit.register(cassette.uninstall)
+    return cassette
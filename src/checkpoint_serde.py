@@ -0,0 +1,212 @@
+# compact binary serializer for checkpoints (PooledSqliteSaver, or any langgraph checkpointer):
+# the JSON of langgraph's JsonPlusSerializer spells out every message as
+# {"lc": 1, "type": "constructor", "id": ["langchain", "schema", "messages", ...], "kwargs": {...}}
+# and is full of repeated text (Tavily results, research passages, response_metadata).
+# CompactSerializer writes msgpack, with LangChain objects as ext types, optionally zstd
+# compressed with a dictionary trained on our own checkpoints. Every blob starts with a header
+# (MAGIC, format version, codec), anything else is read as a legacy JSON/pickle checkpoint.
+import struct
+
+from langchain_core.load.load import Reviver
+from langgraph.checkpoint.sqlite import JsonPlusSerializerCompat
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:  # only uncompressed blobs then
+    zstandard = None
+
+MAGIC = b"LGCK"
+VERSION = 1
+HEADER = struct.Struct("4sBB")  # MAGIC, VERSION, codec
+CODEC_RAW, CODEC_ZSTD, CODEC_ZSTD_DICT = 0, 1, 2
+
+EXT_LANGCHAIN = 1  # Serializable: [dotted id, kwargs]
+EXT_CONSTRUCTOR = 2  # anything else JsonPlusSerializer can encode (UUID, datetime, set, Send, ...)
+EXT_BIGINT = 3  # ints msgpack can't store (beyond 64 bits): their decimal digits
+
+_REVIVER = Reviver()
+
+
+class CompactSerializer:
+    """msgpack checkpoints, zstd compressed if level is not None (with dictionary, if given)
+
+    dictionary: bytes of a zstd dictionary (see train_dictionary()) used for new blobs;
+    old_dictionaries: dictionaries of blobs written before the current one was trained.
+    Blobs without the header (JsonPlusSerializer JSON, pickle) are read as before.
+    """
+
+    def __init__(self, level=3, dictionary=None, old_dictionaries=(), min_size=256):
+        if msgpack is None:
+            raise ImportError("CompactSerializer needs msgpack: pip install msgpack")
+        if (level is not None or dictionary is not None) and zstandard is None:
+            raise ImportError("zstd compression needs zstandard: pip install zstandard (or level=None)")
+        self.level = level
+        self.min_size = min_size  # smaller blobs (e.g. metadata) aren't worth compressing
+        self.legacy = JsonPlusSerializerCompat()
+        self.dictionaries = {}
+        for data in (dictionary, *old_dictionaries):
+            if data is not None:
+                d = zstandard.ZstdCompressionDict(data)
+                self.dictionaries[d.dict_id()] = d
+        self.dictionary = zstandard.ZstdCompressionDict(dictionary) if dictionary is not None else None
+        self._compressor = None
+        self._decompressors = {}
+
+    # msgpack <-> python
+
+    def _default(self, obj):
+        if isinstance(obj, int):
+            return msgpack.ExtType(EXT_BIGINT, str(int(obj)).encode())
+        # the same encodings as JsonPlusSerializer, so the same objects come back
+        value = self.legacy._default(obj)
+        if value.get("lc") == 1 and value.get("type") == "constructor":
+            return msgpack.ExtType(EXT_LANGCHAIN, self.pack([".".join(value["id"]), value["kwargs"]]))
+        return msgpack.ExtType(EXT_CONSTRUCTOR, self.pack(value))
+
+    def _ext_hook(self, code, data):
+        if code == EXT_BIGINT:
+            return int(data)
+        value = self.unpack(data)
+        if code == EXT_LANGCHAIN:
+            return _REVIVER({"lc": 1, "type": "constructor", "id": value[0].split("."), "kwargs": value[1]})
+        if code == EXT_CONSTRUCTOR:
+            return self.legacy._reviver(value)
+        return msgpack.ExtType(code, data)
+
+    def pack(self, obj):
+        return msgpack.packb(obj, default=self._default, use_bin_type=True)
+
+    def unpack(self, data):
+        return msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+
+    # blobs
+
+    def _compress(self, data):
+        if self._compressor is None:
+            self._compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+        return self._compressor.compress(data)
+
+    def _decompress(self, data):
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        decompressor = self._decompressors.get(dict_id)
+        if decompressor is None:
+            if dict_id and dict_id not in self.dictionaries:
+                raise ValueError("checkpoint was compressed with zstd dictionary {}, which isn't loaded".format(dict_id))
+            decompressor = zstandard.ZstdDecompressor(dict_data=self.dictionaries.get(dict_id))
+            self._decompressors[dict_id] = decompressor
+        return decompressor.decompress(data)
+
+    def dumps(self, obj):
+        data = self.pack(obj)
+        codec = CODEC_RAW
+        if self.level is not None and len(data) >= self.min_size:
+            data = self._compress(data)
+            codec = CODEC_ZSTD_DICT if self.dictionary is not None else CODEC_ZSTD
+        return HEADER.pack(MAGIC, VERSION, codec) + data
+
+    def loads(self, data):
+        if not data.startswith(MAGIC):
+            return self.legacy.loads(data)
+        magic, version, codec = HEADER.unpack_from(data)
+        if version > VERSION:
+            raise ValueError("checkpoint format {} is newer than this serializer ({})".format(version, VERSION))
+        body = data[HEADER.size:]
+        if codec != CODEC_RAW:
+            if zstandard is None:
+                raise ImportError("this checkpoint is zstd compressed: pip install zstandard")
+            body = self._decompress(body)
+        return self.unpack(body)
+
+
+def train_dictionary(samples, size=64 * 1024):
+    """zstd dictionary (bytes) trained on sample checkpoints (objects, as given to dumps())"""
+    if zstandard is None:
+        raise ImportError("training a dictionary needs zstandard: pip install zstandard")
+    packer = CompactSerializer(level=None)
+    return zstandard.train_dictionary(size, [packer.pack(sample) for sample in samples]).as_bytes()
+
+
+def sample_checkpoints(path, limit=2000):
+    """Checkpoints stored in a checkpoint SQLite file (any serializer), e.g. to train a dictionary on"""
+    import sqlite3
+    serde = CompactSerializer(level=None)
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT checkpoint FROM checkpoints ORDER BY RANDOM() LIMIT ?", (limit,)).fetchall()
+    finally:
+        conn.close()
+    return [serde.loads(row[0]) for row in rows]
+
+
+def _sample_checkpoint(i):
+    # one agent step of Lesson 4: a question, a tool call, the raw Tavily results, the answer;
+    # and the research passages of ewriter
+    from langgraph.checkpoint.base import empty_checkpoint
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+    city = ["San Francisco", "Los Angeles", "New York", "Chicago", "Seattle"][i % 5]
+    metadata = {"token_usage": {"completion_tokens": 20 + i % 50, "prompt_tokens": 900 + i, "total_tokens": 920 + i},
+                "model_name": "gpt-4o-2024-08-06", "system_fingerprint": "fp_{:x}".format(0xabc123 + i % 3),
+                "finish_reason": "tool_calls", "logprobs": None}
+    weather = str({"location": {"name": city, "region": "California", "country": "United States of America",
+                                "lat": 37.775, "lon": -122.4183, "tz_id": "America/Los_Angeles",
+                                "localtime_epoch": 1736026501 + i, "localtime": "2025-01-04 13:35"},
+                   "current": {"temp_c": 10 + i % 15, "temp_f": 50.0 + i % 27, "is_day": 1,
+                               "condition": {"text": "Partly cloudy", "icon": "//cdn.weatherapi.com/weather/64x64/day/116.png",
+                                             "code": 1003}, "wind_kph": 7.2, "wind_dir": "N", "humidity": 70 + i % 20}})
+    messages = [
+        HumanMessage(content="What is the weather in {}? Should I travel there today?".format(city), id="h{}".format(i)),
+        AIMessage(content="", id="a{}".format(i), response_metadata=metadata,
+                  tool_calls=[{"name": "tavily_search_results_json", "args": {"query": "weather in " + city},
+                               "id": "call_{:08x}".format(i * 7919)}]),
+        ToolMessage(content=str([{"url": "https://www.weatherapi.com/", "content": weather},
+                                 {"url": "https://weather.com/weather/today/l/{}".format(i),
+                                  "content": "Today's forecast for {}: mostly sunny, high near {}F. Winds light and variable. "
+                                             "Check the hourly forecast, radar and maps. ".format(city, 60 + i % 10) * 3}]),
+                    tool_call_id="call_{:08x}".format(i * 7919), name="tavily_search_results_json", id="t{}".format(i)),
+        AIMessage(content="It is partly cloudy in {} with {} degrees, a good day to travel.".format(city, 10 + i % 15),
+                  id="r{}".format(i), response_metadata=dict(metadata, finish_reason="stop")),
+    ]
+    content = ["LangChain is a framework for building LLM applications; LangSmith is a platform for tracing, "
+               "monitoring and evaluating them in production (passage {}).".format(j) for j in range(i % 6)]
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": messages, "content": content, "task": "travel to " + city}
+    checkpoint["channel_versions"] = {"messages": "{:032}.{:x}".format(i, i * 31337), "content": i}
+    checkpoint["versions_seen"] = {"agent": {"messages": i}, "action": {"messages": i - 1}}
+    return checkpoint
+
+
+def benchmark(n=400):
+    """Size and speed of JsonPlusSerializer vs CompactSerializer (raw, zstd, zstd + trained dictionary)"""
+    import time
+    samples = [_sample_checkpoint(i) for i in range(2 * n)]
+    train, test = samples[:n], samples[n:]
+    dictionary = train_dictionary(train, size=16 * 1024)
+    json_serde = JsonPlusSerializerCompat()
+    json_size = sum(len(json_serde.dumps(c)) for c in test)
+    print("{} checkpoints, {:.1f} KB JSON each on average".format(n, json_size / n / 1024))
+    print("    {:<32} {:>10} {:>7} {:>13} {:>13}".format("", "bytes", "ratio", "encode MB/s", "decode MB/s"))
+    for label, serde in [("JsonPlusSerializer", json_serde),
+                         ("msgpack", CompactSerializer(level=None)),
+                         ("msgpack + zstd 3", CompactSerializer(level=3)),
+                         ("msgpack + zstd 3 + dictionary", CompactSerializer(level=3, dictionary=dictionary))]:
+        start = time.perf_counter()
+        blobs = [serde.dumps(c) for c in test]
+        encode = time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = [serde.loads(b) for b in blobs]
+        decode = time.perf_counter() - start
+        size = sum(map(len, blobs))
+        # throughput in JSON-equivalent bytes, so that the rows compare
+        print("    {:<32} {:10.0f} {:6.1f}x {:13.1f} {:13.1f}".format(
+            label, size / n, json_size / size, json_size / encode / 1e6, json_size / decode / 1e6))
+        assert decoded[0]["channel_values"] == test[0]["channel_values"]
+    # the old JSON checkpoints stay readable:
+    assert CompactSerializer().loads(json_serde.dumps(test[0]))["channel_values"] == test[0]["channel_values"]
+
+
+if __name__ == "__main__":
+    benchmark()
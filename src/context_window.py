@@ -0,0 +1,121 @@
+# token budget for the growing message history of the Lesson 1 Agent
+import time
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a rough estimate
+    tiktoken = None
+
+MESSAGE_OVERHEAD = 4  # tokens for role and separators of every chat message
+
+
+# model -> tiktoken encoding; failures aren't cached, they are retried after RETRY_AFTER seconds
+RETRY_AFTER = 60
+_encodings = {}
+_failed = {}  # model -> time.monotonic() of the last failed load
+
+
+def _encoding(model):
+    encoding = _encodings.get(model)
+    if encoding is not None or tiktoken is None:
+        return encoding
+    failed = _failed.get(model)
+    if failed is not None and time.monotonic() - failed < RETRY_AFTER:
+        return None
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:  # the encoding files are downloaded on first use, e.g. offline
+        _failed[model] = time.monotonic()
+        return None
+    _failed.pop(model, None)
+    _encodings[model] = encoding
+    return encoding
+
+
+def count_tokens(text, model="gpt-4o"):
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1  # rule of thumb for English text
+    return len(encoding.encode(text))
+
+
+def truncating_summary(summary, messages, max_chars=200, max_summary_chars=2000):
+    """Default summarizer: appends the first max_chars of every folded message, keeps the last max_summary_chars"""
+    lines = [summary] if summary else []
+    for m in messages:
+        text = " ".join(m["content"].split())
+        if len(text) > max_chars:
+            text = text[:max_chars] + "..."
+        lines.append("{}: {}".format(m["role"], text))
+    return "\n".join(lines)[-max_summary_chars:]
+
+
+class ContextWindow:
+    """Keeps the prompt an Agent sends below max_tokens
+
+    The system prompt and the last keep_turns turns are always sent verbatim. Once the
+    prompt would exceed max_tokens, older turns are folded into a rolling summary
+    (summarize(previous_summary, messages) -> new summary). Every message is tokenized
+    only once, when it is first seen.
+    """
+
+    def __init__(self, max_tokens=2000, keep_turns=3, model="gpt-4o", summarize=truncating_summary):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.model = model
+        self.summarize = summarize
+        self.counts = []   # token count per message of the full history
+        self.total = 0     # sum(self.counts)
+        self.summary = ""
+        self.summary_tokens = 0
+        self.folded = 0    # number of messages (after the system prompt) that are in the summary
+        self.folded_tokens = 0
+        self.savings = []  # tokens saved per call
+
+    def _count(self, messages):
+        for m in messages[len(self.counts):]:
+            n = count_tokens(m["content"], self.model) + MESSAGE_OVERHEAD
+            self.counts.append(n)
+            self.total += n
+
+    def _tail_start(self, messages, start):
+        # index of the first message of the last keep_turns turns (a turn starts with a user message)
+        users = 0
+        for i in range(len(messages) - 1, start - 1, -1):
+            if messages[i]["role"] == "user":
+                users += 1
+                if users == self.keep_turns:
+                    return i
+        return start
+
+    def build(self, messages):
+        """Return the messages to send for the full history `messages`"""
+        self._count(messages)
+        start = 1 if messages and messages[0]["role"] == "system" else 0
+        first = start + self.folded
+        sent = self.total - self.folded_tokens + self.summary_tokens
+        if sent > self.max_tokens:
+            tail = self._tail_start(messages, start)
+            if tail > first:
+                self.summary = self.summarize(self.summary, messages[first:tail])
+                self.summary_tokens = count_tokens(self.summary, self.model) + MESSAGE_OVERHEAD
+                self.folded_tokens += sum(self.counts[first:tail])
+                self.folded = tail - start
+                first = tail
+                sent = self.total - self.folded_tokens + self.summary_tokens
+        self.savings.append(self.total - sent)
+        if not self.summary:
+            return list(messages)
+        summary = {"role": "system", "content": "Summary of the earlier conversation:\n" + self.summary}
+        return messages[:start] + [summary] + messages[first:]
+
+    @property
+    def last_saved(self):
+        return self.savings[-1] if self.savings else 0
+
+    def report(self):
+        return {"calls": len(self.savings), "history_tokens": self.total,
+                "saved_last_call": self.last_saved, "saved_total": sum(self.savings)}
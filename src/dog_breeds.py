@@ -0,0 +1,120 @@
+# indexed breed table behind the average_dog_weight action of Lesson 1
+# (replaces the `name in "Scottish Terrier"` if/elif chain, which also matched "" and "Terrier")
+import csv
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+DEFAULT_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dog_breeds.csv")
+DEFAULT_ANSWER = "An average dog weights 50 lbs"
+
+
+def normalize(name):
+    """Lower case words without punctuation or plural s, e.g. "Scottish-Terriers " -> "scottish terrier" """
+    words = re.findall(r"[a-z0-9]+", name.lower())
+    return " ".join(w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words)
+
+
+def _trigrams(key):
+    padded = " {} ".format(key)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class BreedIndex:
+    """Exact lookups through a hash index of normalized names, fuzzy ones through a trigram index"""
+
+    def __init__(self, weights, min_score=0.75, min_margin=0.05):
+        self.min_score = min_score
+        self.min_margin = min_margin  # a fuzzy match must beat the runner-up by this much
+        self.breeds = []   # [(breed, weight)]
+        self.exact = {}    # normalized name -> breed id
+        self.grams = defaultdict(list)  # trigram -> breed ids
+        self.gram_counts = []
+        for breed, weight in weights.items():
+            key = normalize(breed)
+            if not key or key in self.exact:
+                continue
+            i = len(self.breeds)
+            self.breeds.append((breed, weight))
+            self.exact[key] = i
+            grams = _trigrams(key)
+            self.gram_counts.append(len(grams))
+            for g in grams:
+                self.grams[g].append(i)
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_TABLE, **kwargs):
+        """Load a breed,average_weight_lbs CSV file or a JSON file ({breed: weight} or a list of rows)"""
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".json"):
+                rows = json.load(f)
+                if isinstance(rows, dict):
+                    return cls({k: float(v) for k, v in rows.items()}, **kwargs)
+            else:
+                rows = list(csv.DictReader(f))
+        return cls({r["breed"]: float(r["average_weight_lbs"]) for r in rows}, **kwargs)
+
+    def __len__(self):
+        return len(self.breeds)
+
+    def lookup(self, name, fuzzy=True):
+        """Return (breed, weight) for a breed name, or None if there is no (unambiguous) match"""
+        key = normalize(name or "")
+        if not key:
+            return None
+        i = self.exact.get(key)
+        if i is None and fuzzy:
+            i = self._fuzzy(key)
+        return None if i is None else self.breeds[i]
+
+    def lookup_many(self, names, fuzzy=True):
+        """Batch lookup, every distinct name is only resolved once"""
+        seen = {}
+        results = []
+        for name in names:
+            if name not in seen:
+                seen[name] = self.lookup(name, fuzzy=fuzzy)
+            results.append(seen[name])
+        return results
+
+    def _fuzzy(self, key):
+        # only breeds sharing at least one trigram with the query are scored:
+        grams = _trigrams(key)
+        shared = Counter()
+        for g in grams:
+            shared.update(self.grams.get(g, ()))
+        scores = []
+        for i, n in shared.items():
+            dice = 2 * n / (len(grams) + self.gram_counts[i])
+            containment = n / len(grams)  # so that "labrador" still finds "labrador retriever"
+            scores.append(((dice + containment) / 2, i))
+        if not scores:
+            return None
+        scores.sort(reverse=True)
+        best, i = scores[0]
+        if best < self.min_score:
+            return None
+        # e.g. "terrier" fits many breeds equally well:
+        if len(scores) > 1 and best - scores[1][0] < self.min_margin:
+            return None
+        return i
+
+
+@lru_cache(maxsize=None)
+def default_index():
+    return BreedIndex.from_file(DEFAULT_TABLE)
+
+
+def format_weight(weight):
+    return "{:g}".format(weight)
+
+
+def average_dog_weight(name):
+    """average_dog_weight action: returns average weight of a dog when given the breed"""
+    match = default_index().lookup(name)
+    if match is None:
+        return DEFAULT_ANSWER
+    breed, weight = match
+    return "a {}s average weight is {} lbs".format(breed, format_weight(weight))
@@ -0,0 +1,19 @@
+# graph rendering for the lessons: only done in Jupyter/IPython, so that running a lesson
+# as a script (or importing it) doesn't import IPython or render with pygraphviz
+import sys
+
+
+def in_ipython():
+    # a running IPython has imported itself already, asking must not import it:
+    ipython = sys.modules.get("IPython")
+    return ipython is not None and ipython.get_ipython() is not None
+
+
+def show_graph(graph):
+    """Display graph (a compiled graph) as PNG in a notebook, do nothing elsewhere"""
+    if not in_ipython():
+        return None
+    from IPython.display import Image, display
+    image = Image(graph.get_graph().draw_png())
+    display(image)
+    return image
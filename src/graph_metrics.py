@@ -0,0 +1,205 @@
+# per-node and per-thread token, cost and latency accounting for the LangGraph agents
+# (Agent in the lessons, ewriter in helper.py)
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# USD per 1M tokens: (prompt, cached prompt, completion), matched by model name prefix
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+}
+
+# (thread_id, node) of the node running in the current context
+_current_node = contextvars.ContextVar("graph_metrics_node", default=(None, None))
+
+
+def llm_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    for prefix in sorted(PRICES, key=len, reverse=True):
+        if model and model.startswith(prefix):
+            prompt, cached, completion = PRICES[prefix]
+            return ((prompt_tokens - cached_tokens) * prompt + cached_tokens * cached
+                    + completion_tokens * completion) / 1_000_000
+    return 0.0
+
+
+class _UsageHandler(BaseCallbackHandler):
+    """Records time and token usage of every LLM call, attributed to the node it runs in"""
+    run_inline = True  # stay in the context of the node
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.starts[run_id] = time.monotonic()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.starts[run_id] = time.monotonic()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self.starts.pop(run_id, None)
+        # cache hits (set_llm_cache) come without llm_output, so they count no tokens:
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        model = llm_output.get("model_name")
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        self.metrics.record(
+            "llm", model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+            cached_tokens=cached, cost=llm_cost(model, prompt_tokens, completion_tokens, cached),
+            seconds=time.monotonic() - start if start else None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.starts.pop(run_id, None)
+
+
+class GraphMetrics:
+    """Wall time per node execution, tokens and cost per LLM call, time per tool call, per thread_id
+
+    Attach it by wrapping the nodes (wrap_node), the model (instrument_model or
+    ChatOpenAI(callbacks=[metrics.handler])) and passing it to run_tool_calls().
+    """
+
+    def __init__(self, max_records=100_000):
+        self.max_records = max_records
+        self.records = []
+        self.lock = threading.Lock()
+        self.handler = _UsageHandler(self)
+
+    def record(self, kind, **fields):
+        thread_id, node = _current_node.get()
+        record = {"kind": kind, "ts": time.time(), "thread_id": thread_id, "node": node}
+        record.update(fields)
+        with self.lock:
+            self.records.append(record)
+            if len(self.records) > self.max_records:
+                del self.records[:len(self.records) - self.max_records]
+
+    @contextlib.contextmanager
+    def node(self, name, config):
+        """Attribute everything recorded inside the block to node `name` of config's thread, record its wall time"""
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        token = _current_node.set((thread_id, name))
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record("node", seconds=time.monotonic() - start)
+            _current_node.reset(token)
+
+    def wrap_node(self, name, fn):
+        """Node function that runs fn(state) and records its wall time under `name`"""
+        def node(state, config):
+            with self.node(name, config):
+                return fn(state)
+        node.__name__ = name
+        return node
+
+    def instrument_model(self, model):
+        return model.with_config(callbacks=[self.handler])
+
+    @contextlib.contextmanager
+    def tool_timer(self, tool):
+        """Time a tool call that doesn't go through run_tool_calls(), e.g. tavily.search in ewriter"""
+        start = time.monotonic()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            self.record("tool", tool=tool, seconds=time.monotonic() - start, error=error)
+
+    # query API
+
+    def query(self, kind=None, thread_id=None, node=None):
+        with self.lock:
+            records = list(self.records)
+        return [r for r in records
+                if (kind is None or r["kind"] == kind)
+                and (thread_id is None or r["thread_id"] == thread_id)
+                and (node is None or r["node"] == node)]
+
+    def threads(self):
+        return sorted({r["thread_id"] for r in self.query()}, key=str)
+
+    def totals(self, thread_id=None):
+        totals = defaultdict(float)
+        for r in self.query(thread_id=thread_id):
+            if r["kind"] == "node":
+                totals["node_runs"] += 1
+                totals["node_seconds"] += r["seconds"]
+            elif r["kind"] == "llm":
+                totals["llm_calls"] += 1
+                totals["llm_seconds"] += r["seconds"] or 0
+                for k in ("prompt_tokens", "completion_tokens", "cached_tokens", "cost"):
+                    totals[k] += r[k]
+            elif r["kind"] == "tool":
+                totals["tool_calls"] += 1
+                totals["tool_seconds"] += r["seconds"] or 0
+                totals["tool_errors"] += r.get("error") is not None
+            elif r["kind"] == "route":
+                totals["routed"] += 1
+                totals["escalations"] += r["model"] == "strong"
+        return dict(totals)
+
+    def by_node(self, thread_id=None):
+        nodes = defaultdict(lambda: defaultdict(float))
+        for r in self.query(thread_id=thread_id):
+            n = nodes[r["node"]]
+            if r["kind"] == "node":
+                n["runs"] += 1
+                n["seconds"] += r["seconds"]
+            elif r["kind"] == "llm":
+                for k in ("prompt_tokens", "completion_tokens", "cached_tokens", "cost"):
+                    n[k] += r[k]
+            elif r["kind"] == "tool":
+                n["tool_seconds"] += r["seconds"] or 0
+        return {node: dict(values) for node, values in nodes.items()}
+
+    # exports
+
+    def export_jsonl(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for r in self.query():
+                f.write(json.dumps(r, default=str) + "\n")
+
+    def export_prometheus(self, path):
+        """Prometheus text format, e.g. for node_exporter's textfile collector"""
+        series = defaultdict(float)
+        for r in self.query():
+            labels = {"thread_id": r["thread_id"], "node": r["node"]}
+            if r["kind"] == "node":
+                series[("agent_node_runs_total", _labels(labels))] += 1
+                series[("agent_node_seconds_total", _labels(labels))] += r["seconds"]
+            elif r["kind"] == "llm":
+                labels["model"] = r["model"]
+                for kind in ("prompt", "completion", "cached"):
+                    series[("agent_llm_tokens_total", _labels(dict(labels, type=kind)))] += r[kind + "_tokens"]
+                series[("agent_llm_cost_usd_total", _labels(labels))] += r["cost"]
+            elif r["kind"] == "tool":
+                labels["tool"] = r["tool"]
+                series[("agent_tool_calls_total", _labels(labels))] += 1
+                series[("agent_tool_seconds_total", _labels(labels))] += r["seconds"] or 0
+        lines = []
+        for name in sorted({name for name, _ in series}):
+            lines.append("# TYPE {} counter".format(name))
+            for (n, labels), value in sorted(series.items()):
+                if n == name:
+                    lines.append("{}{{{}}} {}".format(name, labels, round(value, 6)))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def _labels(labels):
+    return ",".join('{}="{}"'.format(k, ("" if v is None else str(v)).replace("\\", "\\\\").replace('"', '\\"'))
+                    for k, v in sorted(labels.items()))
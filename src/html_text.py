@@ -0,0 +1,208 @@
+# incremental extraction of the heading and paragraph text of scraped pages (Lesson 3):
+# Lesson 3 parses the whole page into a BeautifulSoup tree, then find_all(['h1','h2','h3','p'])
+# and a whole-string re.sub(r'\s+', ' ', ...). TextExtractor reads the page in chunks as they
+# arrive, never builds a tree, drops script/style/ad subtrees and stops at a budget.
+import re
+import time
+import tracemalloc
+from collections import defaultdict
+from html.parser import HTMLParser
+
+from context_window import count_tokens
+
+TEXT_TAGS = {"h1", "h2", "h3", "p"}
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "head"}
+# class/id of ad containers, e.g. "ad", "ad-slot", "adWrapper", "sponsored", "promo_banner":
+AD_RE = re.compile(r"(^|[\s_-])(ads?|adv|advert\w*|sponsor\w*|promo\w*|banner)([\s_-]|$)|(^|\s)ad[A-Z]")
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class TextExtractor(HTMLParser):
+    """Streaming h1/h2/h3/p text extractor with a character (and optional token) budget
+
+    feed() a chunk of HTML, get back the blocks (whitespace-collapsed text of a heading or
+    paragraph) it completed. Once max_chars or max_tokens is reached, done is set, the last
+    block is cut to fit and all further input is ignored.
+    """
+
+    def __init__(self, max_chars=4000, max_tokens=None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.max_tokens = max_tokens
+        self.blocks = []
+        self.chars = 0
+        self.tokens = 0
+        self.done = False
+        self._new = []
+        self._block = None     # text parts of the open h1/h2/h3/p
+        self._skip = None      # tag of the skipped subtree we are in
+        self._inner = None     # tag -> number open inside the skipped subtree
+        self._open = defaultdict(int)  # tag -> number open outside skipped subtrees (but h1/h2/h3/p)
+
+    @property
+    def text(self):
+        return "\n".join(self.blocks)
+
+    def feed(self, data):
+        """Add a chunk of HTML, return the blocks it completed"""
+        if not self.done:
+            super().feed(data)
+            if self.done:
+                # drop the parser's buffered input, nothing more is needed
+                self.reset()
+        new, self._new = self._new, []
+        return new
+
+    def close(self):
+        """End of the page: flush an unclosed block, return the blocks that completed"""
+        if not self.done:
+            super().close()
+            self._end_block()
+        new, self._new = self._new, []
+        return new
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self._skip is not None:
+            if not (self._skip == "head" and tag == "body"):  # </head> is optional
+                if tag not in VOID_TAGS:
+                    self._inner[tag] += 1
+                return
+            self._end_skip()
+        if tag in SKIP_TAGS or (tag not in VOID_TAGS and self._is_ad(attrs)):
+            self._skip = tag
+            self._inner = defaultdict(int, {tag: 1})
+            return
+        if tag in TEXT_TAGS:
+            # <p> and headings can't nest, an open one ends here (like an unclosed <p>):
+            self._end_block()
+            self._block = []
+        elif tag == "br" and self._block is not None:
+            self._block.append(" ")
+        elif tag not in VOID_TAGS:
+            self._open[tag] += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == "br" and self._block is not None and self._skip is None:
+            self._block.append(" ")
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if self._skip is not None:
+            if self._inner[tag]:
+                self._inner[tag] -= 1
+                if tag == self._skip and not self._inner[tag]:
+                    self._end_skip()
+                return
+            if not (self._open[tag] or tag in ("body", "html")):
+                return
+            # a parent of the skipped element closes, so the element was never closed
+            # (e.g. an ad <div> without its </div>): the rest of the page isn't part of it
+            self._end_skip()
+        if self._open[tag]:
+            self._open[tag] -= 1
+        if tag in TEXT_TAGS:
+            self._end_block()
+
+    def _end_skip(self):
+        self._skip = None
+        self._inner = None
+
+    def handle_data(self, data):
+        if self._block is not None and self._skip is None and not self.done:
+            self._block.append(data)
+
+    @staticmethod
+    def _is_ad(attrs):
+        for name, value in attrs:
+            if name in ("class", "id") and value and AD_RE.search(value):
+                return True
+        return False
+
+    def _end_block(self):
+        if self._block is None:
+            return
+        text = " ".join("".join(self._block).split())
+        self._block = None
+        if not text:
+            return
+        if self.chars + len(text) >= self.max_chars:
+            text = text[:self.max_chars - self.chars]
+            self.done = True
+        if self.max_tokens is not None:
+            tokens = count_tokens(text)
+            if self.tokens + tokens >= self.max_tokens:
+                text = text[:int(len(text) * (self.max_tokens - self.tokens) / tokens)]
+                tokens = self.max_tokens - self.tokens
+                self.done = True
+            self.tokens += tokens
+        if text:
+            self.chars += len(text)
+            self.blocks.append(text)
+            self._new.append(text)
+
+
+def extract_text(html, max_chars=4000, max_tokens=None, chunk_size=65536):
+    """All blocks of html (str) within the budget, newline-separated"""
+    extractor = TextExtractor(max_chars, max_tokens)
+    for i in range(0, len(html), chunk_size):
+        extractor.feed(html[i:i + chunk_size])
+        if extractor.done:
+            break
+    extractor.close()
+    return extractor.text
+
+
+def _beautifulsoup_text(html):
+    # the Lesson 3 path
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    weather_data = []
+    for tag in soup.find_all(['h1', 'h2', 'h3', 'p']):
+        weather_data.append(tag.get_text(" ", strip=True))
+    return re.sub(r'\s+', ' ', "\n".join(weather_data))
+
+
+def _sample_page(n=400):
+    # weather.com-like: large inline scripts and styles, ad slots, some headings and paragraphs
+    script = "<script>window.__data=" + '{"k":"' + "v" * 20000 + '"};</script>'
+    parts = ["<html><head><title>Weather</title><style>" + ".c{color:red}" * 2000 + "</style>" + script + "</head><body>"]
+    for i in range(n):
+        parts.append('<div class="ad-slot"><p>Sponsored {}</p><iframe src="x"></iframe></div>'.format(i))
+        parts.append("<section><h2>Forecast {}</h2><p>Partly <b>cloudy</b> with a high of {}&deg;F "
+                     "and winds from the NW.</p></section>".format(i, 50 + i % 20))
+        if i % 10 == 0:
+            parts.append(script)
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def _measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def benchmark(paths=(), max_chars=4000):
+    """Speed and peak memory (tracemalloc) of the BeautifulSoup path vs TextExtractor on saved pages"""
+    pages = [(path, open(path, encoding="utf-8", errors="replace").read()) for path in paths]
+    if not pages:
+        pages = [("synthetic page", _sample_page())]
+    for name, html in pages:
+        print("{} ({:.0f} KB)".format(name, len(html) / 1024))
+        for label, fn in [("BeautifulSoup + find_all + re.sub", lambda: _beautifulsoup_text(html)),
+                          ("TextExtractor, no budget", lambda: extract_text(html, max_chars=10**9)),
+                          ("TextExtractor, {} chars".format(max_chars), lambda: extract_text(html, max_chars))]:
+            text, seconds, peak = _measure(fn)
+            print("    {:<36} {:8.1f} ms  peak {:8.1f} KB  {:7} chars".format(label, seconds * 1000, peak / 1024, len(text)))
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(sys.argv[1:])
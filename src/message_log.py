@@ -0,0 +1,191 @@
+# append-only message history for AgentState["messages"]
+# operator.add builds a new list with the whole history on every step, and call_openai copies it
+# again for [SystemMessage(...)] + messages, so long threads spend quadratic time copying lists
+import operator
+import sys
+import threading
+import time
+from collections.abc import Sequence
+
+
+class _Buffer:
+    __slots__ = ("items", "compact", "lock")
+
+    def __init__(self, items, compact=False):
+        self.items = items
+        self.compact = compact
+        self.lock = threading.Lock()
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) and len(value) < 64 else value
+
+
+class CompactMessage:
+    """Stored form of a message: class, content and only the fields that are set (short strings interned)"""
+    __slots__ = ("cls", "content", "fields")
+
+    def __init__(self, message):
+        self.cls = type(message)
+        self.content = message.content
+        self.fields = {}
+        for k, v in vars(message).items():
+            if k == "content" or not v:
+                continue
+            if k == "response_metadata":
+                # model_name, finish_reason, ... repeat in every AIMessage
+                v = {_intern(mk): _intern(mv) for mk, mv in v.items()}
+            self.fields[sys.intern(k)] = _intern(v)
+
+    def materialize(self):
+        return self.cls(content=self.content, **self.fields)
+
+
+class MessageLog(Sequence):
+    """Read-only view of the first `len` messages of a shared, append-only buffer
+
+    Appending to the newest log extends the shared buffer in place (O(1), nothing is copied);
+    older logs stay valid because they only ever look at their own prefix. Only appending
+    to an older log (a branch, e.g. after time travel) copies that log's prefix once.
+    With compact=True messages are stored as CompactMessage and rebuilt on access.
+    """
+    __slots__ = ("_buffer", "_length")
+
+    def __init__(self, messages=(), compact=False):
+        items = [CompactMessage(m) for m in messages] if compact else list(messages)
+        self._buffer = _Buffer(items, compact)
+        self._length = len(items)
+
+    @classmethod
+    def _view(cls, buffer, length):
+        log = cls.__new__(cls)
+        log._buffer = buffer
+        log._length = length
+        return log
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("message index out of range")
+        item = self._buffer.items[i]
+        return item.materialize() if self._buffer.compact else item
+
+    def __iter__(self):
+        items = self._buffer.items
+        if self._buffer.compact:
+            for i in range(self._length):
+                yield items[i].materialize()
+        else:
+            for i in range(self._length):
+                yield items[i]
+
+    def __eq__(self, other):
+        if isinstance(other, (MessageLog, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return "MessageLog({!r})".format(list(self))
+
+    def __reduce__(self):
+        # pickles (and copies made through pickling) only hold this log's own messages
+        return (MessageLog, (list(self), self._buffer.compact))
+
+    def model_dump(self):
+        # checkpointers: langgraph's JsonPlusSerializer (and checkpoint_serde.CompactSerializer)
+        # store objects with a model_dump() as a call of their class with these keyword arguments
+        return {"messages": list(self), "compact": self._buffer.compact}
+
+    def append(self, messages):
+        """Return a new log with `messages` appended, this log is not changed"""
+        buffer = self._buffer
+        new = [CompactMessage(m) for m in messages] if buffer.compact else list(messages)
+        with buffer.lock:
+            if self._length == len(buffer.items):
+                # we are the newest log of this buffer, extend it in place
+                buffer.items.extend(new)
+                return MessageLog._view(buffer, len(buffer.items))
+        # branch: someone already appended to our prefix, copy it
+        branch = _Buffer(buffer.items[:self._length] + new, buffer.compact)
+        return MessageLog._view(branch, len(branch.items))
+
+    def with_system(self, system_message):
+        """[system_message] + self, without copying the log"""
+        return SystemPrefixed(system_message, self)
+
+
+class SystemPrefixed(Sequence):
+    """A system message followed by a MessageLog, e.g. for model.invoke()"""
+    __slots__ = ("system", "log")
+
+    def __init__(self, system, log):
+        self.system = system
+        self.log = log
+
+    def __len__(self):
+        return len(self.log) + 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self.system if i == 0 else self.log[i - 1]
+
+    def __iter__(self):
+        yield self.system
+        yield from self.log
+
+
+def append_messages(left, right):
+    """Reducer for Annotated[list[AnyMessage], append_messages], like operator.add but without copying"""
+    if not isinstance(left, MessageLog):
+        left = MessageLog(left)
+    if not isinstance(right, (list, tuple, Sequence)) or isinstance(right, str):
+        right = [right]
+    return left.append(right)
+
+
+def compact_append_messages(left, right):
+    """Like append_messages, storing the messages in their compact form"""
+    if not isinstance(left, MessageLog):
+        left = MessageLog(left, compact=True)
+    if not isinstance(right, (list, tuple, Sequence)) or isinstance(right, str):
+        right = [right]
+    return left.append(right)
+
+
+def with_system(system_message, messages):
+    """[system_message] + messages, without copying when messages is a MessageLog"""
+    if isinstance(messages, MessageLog):
+        return messages.with_system(system_message)
+    return [system_message] + list(messages)
+
+
+def benchmark(n=10_000):
+    """Grow a thread to n messages one step at a time, like the llm/action loop does"""
+    from langchain_core.messages import AIMessage, SystemMessage
+    system = SystemMessage(content="You are a smart research assistant.")
+    steps = [[AIMessage(content="message {}".format(i))] for i in range(n)]
+    for label, reducer, prefix in [
+        ("operator.add + [system] + messages", operator.add, lambda m: [system] + m),
+        ("append_messages + with_system", append_messages, lambda m: with_system(system, m)),
+    ]:
+        messages = []
+        start = time.perf_counter()
+        for step in steps:
+            messages = reducer(messages, step)
+            prompt = prefix(messages)
+        seconds = time.perf_counter() - start
+        assert len(prompt) == n + 1
+        print("{:<36} {:8.1f} ms for {} messages".format(label, seconds * 1000, n))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,212 @@
+# concurrent fetching of the pages a web search returned (Lesson 3), so that looking at several
+# pages costs about as long as the slowest of them instead of the sum of all of them
+import asyncio
+import codecs
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import httpx
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0", "Accept-Encoding": "gzip, deflate"}
+
+
+class PageFetcher:
+    """Pooled keep-alive HTTP client with per-host concurrency limits, timeouts and a body size limit
+
+    async with PageFetcher() as fetcher:
+        async for page in fetcher.fetch_all(urls):   # in the order the pages finish
+            ...
+
+    Every page is a dict: url, status, text, error, elapsed (seconds), truncated (body cut at max_bytes).
+    Failures (timeouts, connection errors, HTTP errors) come back as pages with an error, never raise.
+    With extract (e.g. html_text.TextExtractor) every page is fed to a new extract() while it
+    downloads; text is then the extracted text, the raw body is never kept, and the download
+    stops as soon as the extractor is done.
+    """
+
+    def __init__(self, max_connections=20, per_host=2, connect_timeout=3.0, read_timeout=10.0,
+                 total_timeout=15.0, max_bytes=2_000_000, headers=None, extract=None):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.total_timeout = total_timeout
+        self.max_bytes = max_bytes
+        self.headers = dict(DEFAULT_HEADERS, **(headers or {}))
+        self.extract = extract
+        self.client = None
+        self.host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+            timeout=self.timeout, headers=self.headers, follow_redirects=True)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        self.client = None
+
+    async def fetch(self, url):
+        start = time.monotonic()
+        page = {"url": url, "status": None, "text": "", "error": None, "elapsed": None, "truncated": False}
+        try:
+            async with self.host_limits[urlsplit(url).hostname]:
+                await asyncio.wait_for(self._get(url, page), self.total_timeout)
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            page["error"] = "timed out"
+        except (httpx.HTTPError, httpx.InvalidURL, ValueError, LookupError) as e:
+            # ValueError: malformed URL (http://[::1), LookupError: the page has a charset that is no text encoding
+            page["error"] = "{}: {}".format(type(e).__name__, e)
+        page["elapsed"] = time.monotonic() - start
+        return page
+
+    async def _get(self, url, page):
+        async with self.client.stream("GET", url) as response:
+            page["status"] = response.status_code
+            if response.status_code != 200:
+                page["error"] = "HTTP {}".format(response.status_code)
+                return
+            if self.extract is not None:
+                await self._extract(response, page)
+                return
+            body = bytearray()
+            # decompressed chunks, so max_bytes also limits what a gzip bomb can expand to:
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) >= self.max_bytes:
+                    del body[self.max_bytes:]
+                    page["truncated"] = True
+                    break
+            page["text"] = body.decode(response.encoding or "utf-8", errors="replace")
+
+    async def _extract(self, response, page):
+        extractor = self.extract()
+        decoder = _text_decoder(response.encoding or "utf-8")
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            extractor.feed(decoder.decode(chunk))
+            if extractor.done:
+                break
+            if size >= self.max_bytes:
+                page["truncated"] = True
+                break
+        else:
+            extractor.feed(decoder.decode(b"", final=True))
+        extractor.close()
+        page["text"] = extractor.text
+
+    async def fetch_all(self, urls):
+        """Fetch urls (duplicates once) concurrently, yield the pages in the order they finish"""
+        tasks = [asyncio.ensure_future(self.fetch(url)) for url in dict.fromkeys(urls)]
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                yield await next_page
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _text_decoder(encoding):
+    # bytes.decode() refuses bytes-to-bytes codecs like rot13 or hex, the incremental decoders don't:
+    # decoding nothing gives bytes (hex, base64, ...) or raises a TypeError (rot13) for those
+    decoder = codecs.getincrementaldecoder(encoding)
+    try:
+        text = decoder().decode(b"", final=True)
+    except TypeError:
+        text = None
+    if not isinstance(text, str):
+        raise LookupError("{!r} is not a text encoding".format(encoding))
+    return decoder(errors="replace")
+
+
+def fetch_pages(urls, **kwargs):
+    """Synchronous fetch_all() for scripts: list of pages in the order they finished"""
+    async def run():
+        async with PageFetcher(**kwargs) as fetcher:
+            return [page async for page in fetcher.fetch_all(urls)]
+    return asyncio.run(run())
+
+
+def _demo_server():
+    """Local stand-in for the search results: /page?delay=s&size=n&charset=c, /status?code=n, /hang"""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            if parts.path == "/hang":
+                time.sleep(float(query.get("delay", 30)))
+                return
+            if parts.path == "/status":
+                self.send_response(int(query["code"]))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            time.sleep(float(query.get("delay", 0)))
+            body = ("<html><body><h1>Page {}</h1>".format(self.path)
+                    + "<p>" + "x" * int(query.get("size", 100)) + "</p></body></html>").encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset={}".format(query.get("charset", "utf-8")))
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client stopped reading (max_bytes, extractor done)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def demo():
+    server = _demo_server()
+    base = "http://127.0.0.1:{}".format(server.server_address[1])
+    urls = [base + "/page?delay={}&n={}".format(delay, i) for i, delay in enumerate([0.5, 0.3, 0.4, 0.2, 0.5, 0.1])]
+    urls += [base + "/page?size=5000000", base + "/status?code=404", base + "/hang?delay=5"]
+
+    start = time.monotonic()
+    pages = fetch_pages(urls, per_host=10, read_timeout=1.0, total_timeout=2.0, max_bytes=100_000)
+    elapsed = time.monotonic() - start
+    for page in pages:
+        print("{:6.2f}s {:>4} {:8} bytes {}{}  {}".format(
+            page["elapsed"], page["status"] or "-", len(page["text"]), "truncated " if page["truncated"] else "",
+            page["error"] or "", page["url"][len(base):]))
+    print("{} pages in {:.2f}s (sum of page latencies {:.2f}s)".format(
+        len(pages), elapsed, sum(page["elapsed"] for page in pages)))
+
+    by_path = {page["url"][len(base):]: page for page in pages}
+    assert [page["elapsed"] for page in pages] == sorted(page["elapsed"] for page in pages)
+    assert by_path["/page?size=5000000"]["truncated"] and len(by_path["/page?size=5000000"]["text"]) == 100_000
+    assert by_path["/status?code=404"]["error"] == "HTTP 404"
+    assert by_path["/hang?delay=5"]["error"] == "timed out"
+
+    # extraction while downloading: only the text of the page, the ad-free part of the 5 MB page
+    from html_text import TextExtractor
+    pages = fetch_pages([base + "/page?size=5000000", base + "/page?delay=0.1"], extract=lambda: TextExtractor(max_chars=1000))
+    for page in pages:
+        print("extracted {:5} chars in {:.2f}s {}".format(len(page["text"]), page["elapsed"], page["url"][len(base):]))
+    assert all(len(page["text"].replace("\n", "")) <= 1000 for page in pages) and pages[0]["text"].startswith("Page /page")
+
+    # per-host limit: 6 pages of 0.3s with 2 at a time take 3 rounds
+    start = time.monotonic()
+    fetch_pages([base + "/page?delay=0.3&n={}".format(i) for i in range(6)], per_host=2)
+    elapsed = time.monotonic() - start
+    print("6 pages, 2 at a time: {:.2f}s".format(elapsed))
+    assert 0.9 <= elapsed < 1.5
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    demo()
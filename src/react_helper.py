@@ -0,0 +1,120 @@
+# helpers for the hand-written ReAct loop of Lesson 1
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# python regular expression to select actions (same as in Lesson_1_Student.py):
+action_re = re.compile(r'^Action: (\w+): (.*)$')
+
+
+def parse_actions(text):
+    """Return all (action, action_input) pairs of one completion, in order"""
+    return [m.groups() for m in map(action_re.match, text.split('\n')) if m]
+
+
+class ActionRunner:
+    """Runs the actions of one ReAct turn on a bounded thread pool, each limited by a timeout"""
+
+    def __init__(self, known_actions, max_workers=4, timeout=10):
+        self.known_actions = known_actions
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="action")
+        self.pending = []  # (action, action_input, future, deadline)
+
+    def submit(self, action, action_input):
+        if action not in self.known_actions:
+            raise Exception("Unknown action: {}: {}".format(action, action_input))
+        print(" -- running {} {}".format(action, action_input))
+        # with more actions than workers, later actions only start once earlier ones are done,
+        # so every "wave" of max_workers actions gets its own timeout:
+        wave = len(self.pending) // self.max_workers
+        deadline = time.monotonic() + self.timeout * (wave + 1)
+        future = self.pool.submit(self.known_actions[action], action_input)
+        self.pending.append((action, action_input, future, deadline))
+        return future
+
+    def collect(self):
+        """Wait for all submitted actions, return [(action, action_input, observation)] in submission order"""
+        results = []
+        for action, action_input, future, deadline in self.pending:
+            try:
+                observation = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                # python threads cannot be killed, the action keeps running but its result is dropped:
+                future.cancel()
+                observation = "timed out after {}s".format(self.timeout)
+            except Exception as e:
+                observation = "error: {}".format(e)
+            results.append((action, action_input, observation))
+        self.pending = []
+        return results
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_actions(actions, known_actions, max_workers=4, timeout=10):
+    """Run all (action, action_input) pairs concurrently, return their results in order"""
+    runner = ActionRunner(known_actions, max_workers=min(max_workers, len(actions)), timeout=timeout)
+    try:
+        for action, action_input in actions:
+            runner.submit(action, action_input)
+        return runner.collect()
+    finally:
+        runner.shutdown()
+
+
+def format_observation(results):
+    """Combine the results of several actions into one Observation block"""
+    if len(results) == 1:
+        return "Observation: {}".format(results[0][2])
+    lines = ["Observation:"]
+    for action, action_input, observation in results:
+        lines.append("{}: {} -> {}".format(action, action_input, observation))
+    return "\n".join(lines)
+
+
+class ReActStreamParser:
+    """Splits a streamed completion into lines and reports every Action line as soon as it is complete"""
+
+    def __init__(self):
+        self.parts = []
+        self.buffer = ""
+        self.actions = []
+        self.paused = False
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def feed(self, delta):
+        """Add a chunk of streamed text, return the (action, action_input) pairs it completed"""
+        self.parts.append(delta)
+        *lines, self.buffer = (self.buffer + delta).split('\n')
+        new_actions = []
+        for line in lines:
+            self._line(line, new_actions)
+        # PAUSE is the last thing the model writes before waiting for the Observation:
+        if self.buffer.strip() == "PAUSE":
+            self.paused = True
+        return new_actions
+
+    def close(self):
+        """Flush the last (unterminated) line, return the actions it completed"""
+        new_actions = []
+        if self.buffer:
+            self._line(self.buffer, new_actions)
+            self.buffer = ""
+        return new_actions
+
+    def _line(self, line, new_actions):
+        if self.paused:
+            return
+        if line.strip() == "PAUSE":
+            self.paused = True
+            return
+        m = action_re.match(line)
+        if m:
+            self.actions.append(m.groups())
+            new_actions.append(m.groups())
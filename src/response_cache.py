@@ -0,0 +1,228 @@
+# persistent, content-addressed cache for completions of the raw OpenAI client (Lesson 1)
+# and of LangChain chat models (Lessons 2, 4, 5), so that reruns of a script don't pay again
+import contextlib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import types
+
+try:
+    from langchain_core.caches import BaseCache
+    from langchain_core.load import dumps as lc_dumps, loads as lc_loads
+except ImportError:  # raw OpenAI client only
+    BaseCache = object
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".response_cache.sqlite")
+
+
+def _normalize(obj):
+    # surrounding whitespace of prompts should not cause a cache miss
+    if isinstance(obj, str):
+        return obj.strip()
+    if isinstance(obj, dict):
+        return {k: _normalize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_normalize(v) for v in obj]
+    return obj
+
+
+def cache_key(**request):
+    """Stable hash of model, parameters, tools and normalized messages of a request"""
+    blob = json.dumps(_normalize(request), sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+# "temperature": 0.7 in the serialized model, ('temperature', 0.7) in the call parameters of an llm_string
+_TEMPERATURE_RE = re.compile(r"""["']temperature["'][:,]\s*([^,)}\s]+)""")
+
+
+def _temperature(llm_string):
+    """The temperature of a LangChain llm_string (call parameters win), None if it doesn't say"""
+    values = _TEMPERATURE_RE.findall(llm_string)
+    try:
+        return float(values[-1]) if values else None
+    except ValueError:  # None/null
+        return None
+
+
+class ResponseCache:
+    """SQLite file of serialized responses with an LRU size limit and an optional TTL (seconds)
+
+    Only deterministic requests (temperature 0) are cached, unless sampled=True: a cached
+    answer of a sampling request would be the same on every rerun.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=256 * 1024 * 1024, ttl=None, sampled=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sampled = sampled
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+        """)
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @contextlib.contextmanager
+    def bypass(self):
+        """Calls inside this block (in the current thread) neither read nor write the cache"""
+        previous = getattr(self.local, "bypass", False)
+        self.local.bypass = True
+        try:
+            yield
+        finally:
+            self.local.bypass = previous
+
+    @property
+    def bypassed(self):
+        return getattr(self.local, "bypass", False)
+
+    def get(self, key):
+        if self.bypassed:
+            return None
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._delete([key])
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            self.bytes_saved += len(row[0])
+        return row[0]
+
+    def put(self, key, value):
+        if self.bypassed:
+            return
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                              (key, value, len(value), now, now))
+            self.total_bytes += len(value) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                # evict least recently used entries until we are below the limit again:
+                excess = self.total_bytes - self.max_bytes
+                victims = []
+                for victim, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    if excess <= 0:
+                        break
+                    victims.append(victim)
+                    excess -= size
+                for i in range(0, len(victims), 500):
+                    self._delete(victims[i:i + 500])
+            self.conn.commit()
+
+    def _delete(self, keys):
+        marks = ",".join("?" * len(keys))
+        freed = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses WHERE key IN ({})".format(marks),
+                                  keys).fetchone()[0]
+        self.conn.execute("DELETE FROM responses WHERE key IN ({})".format(marks), keys)
+        self.total_bytes -= freed
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "bytes_saved": self.bytes_saved,
+                    "entries": entries, "bytes": self.total_bytes}
+
+    def caches(self, temperature):
+        """Whether requests with this temperature (None: unknown, i.e. the provider's default) are cached"""
+        return self.sampled or temperature == 0
+
+    def wrap_openai(self, client):
+        return CachedOpenAI(client, self)
+
+    def for_langchain(self):
+        return LangChainCache(self)
+
+
+def enable_cache(**kwargs):
+    """Serve all LangChain chat models from a ResponseCache(**kwargs) (set_llm_cache), return the cache
+
+    Returns None without a cache with RESPONSE_CACHE=off, and while a cassette is recorded
+    (CASSETTE_MODE=record, see cassette.py): cached answers never reach HTTP, so the cassette
+    would miss them on replay.
+    """
+    if os.getenv("RESPONSE_CACHE", "on").lower() in ("off", "0", "false") or os.getenv("CASSETTE_MODE") == "record":
+        return None
+    from langchain_core.globals import set_llm_cache
+    cache = ResponseCache(**kwargs)
+    set_llm_cache(cache.for_langchain())
+    return cache
+
+
+class CachedOpenAI:
+    """OpenAI client whose chat.completions.create() is served from a ResponseCache (streams are not cached)"""
+
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _create(self, **kwargs):
+        # the API samples with temperature 1 by default
+        if kwargs.get("stream") or not self.cache.caches(kwargs.get("temperature", 1)):
+            return self.client.chat.completions.create(**kwargs)
+        from openai.types.chat import ChatCompletion
+        key = cache_key(api="chat.completions", **kwargs)
+        blob = self.cache.get(key)
+        if blob is not None:
+            return ChatCompletion.model_validate_json(blob)
+        completion = self.client.chat.completions.create(**kwargs)
+        self.cache.put(key, completion.model_dump_json().encode("utf-8"))
+        return completion
+
+
+class LangChainCache(BaseCache):
+    """LangChain cache backed by a ResponseCache, use with set_llm_cache() or ChatOpenAI(cache=...)"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def lookup(self, prompt, llm_string):
+        # llm_string holds model name, parameters and bound tools, prompt the serialized messages
+        if not self.cache.caches(_temperature(llm_string)):
+            return None
+        blob = self.cache.get(cache_key(api="langchain", llm=llm_string, prompt=prompt))
+        return None if blob is None else lc_loads(blob.decode("utf-8"))
+
+    def update(self, prompt, llm_string, return_val):
+        if not self.cache.caches(_temperature(llm_string)):
+            return
+        self.cache.put(cache_key(api="langchain", llm=llm_string, prompt=prompt),
+                       lc_dumps(return_val).encode("utf-8"))
+
+    def clear(self, **kwargs):
+        self.cache.clear()
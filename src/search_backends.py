@@ -0,0 +1,227 @@
+# one interface for the search providers of Lesson 3 (Tavily, DuckDuckGo) and hedged requests
+# across them: when the primary hasn't answered within its p90 latency the secondary is asked too,
+# and whichever answers first wins, which cuts the tail latency of search-heavy agent turns
+import math
+import random
+from abc import ABC, abstractmethod
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class SearchResult:
+    """One search hit, the same for every backend"""
+    __slots__ = ("title", "url", "content", "score", "backend")
+
+    def __init__(self, title, url, content, score=None, backend=None):
+        self.title = title
+        self.url = url
+        self.content = content
+        self.score = score
+        self.backend = backend
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return "SearchResult({!r}, {!r}, backend={!r})".format(self.title, self.url, self.backend)
+
+
+class SearchBackend(ABC):
+    """search(query, max_results) -> [SearchResult]"""
+    name = "backend"
+
+    @abstractmethod
+    def search(self, query, max_results=5):
+        ...
+
+
+class TavilyBackend(SearchBackend):
+    name = "tavily"
+
+    def __init__(self, client=None):
+        if client is None:
+            import os
+            from tavily import TavilyClient
+            client = TavilyClient(api_key=os.environ.get("TAVILY_API_KEY"))
+        self.client = client
+
+    def search(self, query, max_results=5):
+        response = self.client.search(query, max_results=max_results)
+        return [SearchResult(r.get("title", ""), r["url"], r.get("content", ""), r.get("score"), self.name)
+                for r in response["results"]]
+
+
+class DuckDuckGoBackend(SearchBackend):
+    """DDGS().text() results; pass search (e.g. a SearchCache's) to share its cache and rate limit"""
+    name = "ddg"
+
+    def __init__(self, ddg=None, search=None):
+        if search is None:
+            if ddg is None:
+                from duckduckgo_search import DDGS
+                ddg = DDGS()
+
+            def search(query, max_results):
+                return ddg.text(query, max_results=max_results)
+        self.text = search
+
+    def search(self, query, max_results=5):
+        return [SearchResult(r.get("title", ""), r["href"], r.get("body", ""), None, self.name)
+                for r in self.text(query, max_results)]
+
+
+class LatencyHistogram:
+    """Latencies in logarithmic buckets (4 per doubling, from 1 ms), for percentiles in O(buckets)"""
+    BASE = 2 ** 0.25
+    MIN = 0.001
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        bucket = max(0, math.ceil(math.log(max(seconds, self.MIN) / self.MIN, self.BASE)))
+        with self.lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.count += 1
+
+    def percentile(self, q):
+        """Upper bound (seconds) of the bucket holding the q-quantile, None without samples"""
+        with self.lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bucket in sorted(self.counts):
+                seen += self.counts[bucket]
+                if seen >= rank:
+                    return self.MIN * self.BASE ** bucket
+
+
+class HedgedSearch(SearchBackend):
+    """Ask primary; if it hasn't answered after its hedge_quantile latency, ask secondary too
+
+    The first successful answer wins, the other request is cancelled (a request that is already
+    running in its thread can't be interrupted, its late answer is only used for the latency
+    histogram). Until a backend has min_samples latencies, default_delay is used.
+    If both fail, the primary's error is raised.
+    """
+    name = "hedged"
+
+    def __init__(self, primary, secondary, hedge_quantile=0.9, min_samples=20, default_delay=1.0,
+                 min_delay=0.05, max_workers=8):
+        self.primary = primary
+        self.secondary = secondary
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.histograms = {primary.name: LatencyHistogram(), secondary.name: LatencyHistogram()}
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self.lock = threading.Lock()
+        self.counters = {"searches": 0, "hedged": 0, "wins_" + primary.name: 0, "wins_" + secondary.name: 0,
+                         "errors_" + primary.name: 0, "errors_" + secondary.name: 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def hedge_delay(self):
+        histogram = self.histograms[self.primary.name]
+        if histogram.count < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, histogram.percentile(self.hedge_quantile))
+
+    def _submit(self, backend, query, max_results):
+        start = time.monotonic()
+
+        def run():
+            try:
+                results = backend.search(query, max_results)
+            except Exception:
+                self._count("errors_" + backend.name)
+                raise
+            self.histograms[backend.name].record(time.monotonic() - start)
+            return results
+        future = self.pool.submit(run)
+        future.backend = backend
+        return future
+
+    def search(self, query, max_results=5):
+        self._count("searches")
+        primary = self._submit(self.primary, query, max_results)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done and primary.exception() is None:
+            self._count("wins_" + self.primary.name)
+            return primary.result()
+        self._count("hedged")
+        pending = {primary, self._submit(self.secondary, query, max_results)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    self._count("wins_" + future.backend.name)
+                    return future.result()
+        return primary.result()  # both failed
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        for name, histogram in self.histograms.items():
+            stats["p50_" + name] = histogram.percentile(0.5)
+            stats["p90_" + name] = histogram.percentile(0.9)
+        stats["hedge_delay"] = self.hedge_delay()
+        return stats
+
+
+class _StandInBackend(SearchBackend):
+    """Local stand-in for a provider: latency usually `typical`, `slow` with probability tail_rate"""
+
+    def __init__(self, name, typical, slow, tail_rate, error_rate=0.0, seed=0):
+        self.name = name
+        self.typical = typical
+        self.slow = slow
+        self.tail_rate = tail_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+    def search(self, query, max_results=5):
+        r = self.random.random()
+        time.sleep(self.slow if r < self.tail_rate else self.typical * self.random.uniform(0.8, 1.2))
+        if self.random.random() < self.error_rate:
+            raise RuntimeError("{} rate limited".format(self.name))
+        return [SearchResult(query, "https://{}.example/{}".format(self.name, i), "...", None, self.name)
+                for i in range(max_results)]
+
+
+def demo(n=100):
+    """Tail latency of the primary alone vs hedged with a secondary, on local stand-in backends"""
+    def run(backend):
+        latencies = []
+        for i in range(n):
+            start = time.monotonic()
+            results = backend.search("query {}".format(i), 2)
+            assert len(results) == 2
+            latencies.append(time.monotonic() - start)
+        latencies.sort()
+        return [latencies[int(q * (n - 1))] for q in (0.5, 0.95, 0.99)]
+
+    # primary: fast, but 10% of the requests hang for half a second; secondary: slower,
+    # rarely slow, sometimes rate limited (then the hedged search waits for the primary)
+    alone = run(_StandInBackend("tavily", 0.03, 0.5, 0.1, seed=1))
+    hedged = HedgedSearch(_StandInBackend("tavily", 0.03, 0.5, 0.1, seed=1),
+                          _StandInBackend("ddg", 0.06, 0.5, 0.01, error_rate=0.05, seed=2),
+                          hedge_quantile=0.8, min_samples=10, default_delay=0.2)
+    with_hedging = run(hedged)
+    print("primary alone  p50 {:.3f}s  p95 {:.3f}s  p99 {:.3f}s".format(*alone))
+    print("hedged         p50 {:.3f}s  p95 {:.3f}s  p99 {:.3f}s".format(*with_hedging))
+    print(hedged.stats())
+    assert with_hedging[1] < alone[1] / 2
+
+
+if __name__ == "__main__":
+    demo()
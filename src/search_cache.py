@@ -0,0 +1,164 @@
+# persistent cache for the web searches of Lesson 3 (DuckDuckGo): repeated and popular queries
+# are answered from disk, stale entries are served while they are refreshed in the background,
+# and requests to the provider go through a token bucket with jittered exponential backoff,
+# so a rate-limited provider means a slower (or failed) search, never somebody else's results
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".search_cache.sqlite")
+
+
+class SearchUnavailable(RuntimeError):
+    """The provider kept failing (e.g. rate limited) and nothing usable was cached"""
+
+
+def normalize_query(query):
+    # case and whitespace (e.g. of triple-quoted queries) don't change the results
+    return " ".join(query.casefold().split())
+
+
+def query_key(query, **params):
+    blob = json.dumps({"query": normalize_query(query), **params}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class TokenBucket:
+    """At most `rate` requests per second on average, bursts of up to `burst` (thread-safe)"""
+
+    def __init__(self, rate=1.0, burst=3):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SearchCache:
+    """SQLite cache in front of fetch(query, max_results) -> JSON-serializable results
+
+    Entries younger than ttl are served as they are (hit); entries up to ttl + stale_ttl old
+    are served and refreshed in the background (stale); older or missing entries are
+    fetched (miss). A fetch is retried max_retries times with jittered exponential backoff,
+    then SearchUnavailable is raised.
+    """
+
+    def __init__(self, fetch, path=DEFAULT_PATH, ttl=3600, stale_ttl=24 * 3600, rate=1.0, burst=3,
+                 max_retries=3, backoff=1.0, max_backoff=30.0, namespace=None):
+        self.fetch = fetch
+        self.namespace = namespace  # keeps apart the results of different fetch functions in one file
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.counters = {"hits": 0, "stale": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0,
+                         "retries": 0, "failures": 0}
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        self.pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-refresh")
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS searches (
+                key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                results TEXT NOT NULL,
+                fetched REAL NOT NULL
+            );
+        """)
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT results, fetched FROM searches WHERE key = ?", (key,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, None)
+
+    def _put(self, key, query, results):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?)",
+                              (key, normalize_query(query), json.dumps(results), time.time()))
+            self.conn.commit()
+
+    def search(self, query, max_results=6):
+        if self.namespace is None:
+            key = query_key(query, max_results=max_results)
+        else:
+            key = query_key(query, max_results=max_results, namespace=self.namespace)
+        results, fetched = self._get(key)
+        if results is not None:
+            age = time.time() - fetched
+            if age <= self.ttl:
+                self._count("hits")
+                return results
+            if age <= self.ttl + self.stale_ttl:
+                self._count("stale")
+                self._refresh_in_background(key, query, max_results)
+                return results
+        self._count("misses")
+        results = self._fetch(query, max_results)
+        self._put(key, query, results)
+        return results
+
+    def _fetch(self, query, max_results):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                return self.fetch(query, max_results)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise SearchUnavailable("search for {!r} failed {} times: {!r}".format(
+                        query, attempt + 1, e)) from e
+                self._count("retries")
+                # jitter, so that concurrent callers don't retry in lockstep:
+                time.sleep(min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def _refresh_in_background(self, key, query, max_results):
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+        self.pool.submit(self._refresh, key, query, max_results)
+
+    def _refresh(self, key, query, max_results):
+        try:
+            self._put(key, query, self._fetch(query, max_results))
+            self._count("refreshes")
+        except SearchUnavailable:
+            self._count("refresh_errors")  # keep serving the stale entry
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+            return dict(self.counters, entries=entries)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM searches")
+            self.conn.commit()
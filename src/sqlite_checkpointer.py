@@ -0,0 +1,657 @@
+# file-backed checkpointer for the LangGraph agents (Lessons 4-6, helper.ewriter):
+# SqliteSaver on ":memory:" loses every thread on restart, and all graph threads (e.g. the
+# Gradio workers of writer_gui) share one connection. PooledSqliteSaver keeps the same table
+# (so existing checkpoint files stay readable) in a WAL-mode file, writes through one writer
+# connection with batched commits and reads through a pool of reader connections, which in WAL
+# mode don't block the writer or each other.
+# Append-only channels (the messages of the agents, the research content of ewriter) are stored
+# as deltas: only the items appended since the parent checkpoint, with a full snapshot every
+# snapshot_every steps, so a thread of n steps no longer stores O(n^2) items.
+# RetentionPolicy/apply_retention() delete old checkpoints (time travel and the history of
+# writer_gui otherwise keep every one of them forever), optionally in a background thread.
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+from langgraph.checkpoint.sqlite import JsonPlusSerializerCompat, SqliteSaver, search_where
+from langgraph.serde.jsonplus import JsonPlusSerializer
+
+PRAGMAS = """
+    PRAGMA auto_vacuum=INCREMENTAL;  -- only takes effect for a new file (see enable_incremental_vacuum()), before WAL
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;
+    PRAGMA mmap_size=268435456;
+    PRAGMA journal_size_limit=16777216;  -- checkpoints cut the -wal file back to 16 MB
+"""
+# channel value of a delta checkpoint: {DELTA_KEY: [length of the parent's list, appended items]}
+DELTA_KEY = "__checkpoint_delta__"
+
+
+class RetentionPolicy:
+    """Which checkpoints apply_retention() keeps
+
+    keep_last: the newest keep_last checkpoints of every thread (at least 1: the newest one is the thread's state);
+    keep_branch_points: checkpoints with more than one child (update_state on an older checkpoint);
+    keep_interrupts: checkpoints changed by hand (source "update"), the ones they were made from,
+    and the checkpoints written by one of interrupt_nodes (e.g. the graph's interrupt_after);
+    idle_ttl: seconds after its last checkpoint a whole thread is deleted (None: never).
+    """
+
+    def __init__(self, keep_last=50, keep_branch_points=True, keep_interrupts=True, interrupt_nodes=(),
+                 idle_ttl=None):
+        if keep_last < 1:
+            raise ValueError("keep_last must be at least 1, not {}".format(keep_last))
+        self.keep_last = keep_last
+        self.keep_branch_points = keep_branch_points
+        self.keep_interrupts = keep_interrupts
+        self.interrupt_nodes = set(interrupt_nodes)
+        self.idle_ttl = idle_ttl
+
+    def keep(self, checkpoints):
+        """thread_ts of the checkpoints to keep of [(thread_ts, parent_ts, metadata)], newest first"""
+        keep = {ts for ts, _, _ in checkpoints[:self.keep_last]}
+        if self.keep_branch_points:
+            children = {}
+            for _, parent_ts, _ in checkpoints:
+                children[parent_ts] = children.get(parent_ts, 0) + 1
+            keep.update(ts for ts, _, _ in checkpoints if children.get(ts, 0) > 1)
+        if self.keep_interrupts:
+            for ts, parent_ts, metadata in checkpoints:
+                if metadata.get("source") == "update":
+                    keep.add(ts)
+                    if parent_ts:
+                        keep.add(parent_ts)
+                elif self.interrupt_nodes.intersection(metadata.get("writes") or ()):
+                    keep.add(ts)
+        return keep
+
+
+class PooledSqliteSaver(BaseCheckpointSaver):
+    """Checkpointer on a SQLite file: one writer, pool_size readers, batched commits
+
+    Writes are committed once batch_size of them are pending or flush_interval seconds after the
+    first of them (by a background thread), so a crash can lose at most the last flush_interval
+    seconds of checkpoints. A read first commits the pending writes of the thread it reads (all
+    pending writes for reads across threads), so reads always see all earlier writes.
+    Use as a context manager, or call close(), to flush on exit.
+
+    List values of delta_channels that extend the parent checkpoint's list are stored as the
+    appended items only; a checkpoint whose parent is snapshot_every - 1 deltas away from a full
+    snapshot is stored in full. Reads put the lists back together (the last cache_size
+    reconstructed checkpoints are cached), so get_tuple() and list() return the same
+    checkpoints as without deltas. delta_channels=() turns deltas off; SqliteSaver can't read
+    delta checkpoints.
+    serde: e.g. checkpoint_serde.CompactSerializer for smaller blobs; files written with the
+    default (JSON) serializer stay readable with it.
+    Old checkpoints are deleted by apply_retention() or start_retention() (see RetentionPolicy).
+    """
+    serde = JsonPlusSerializerCompat()
+
+    def __init__(self, path="checkpoints.sqlite", pool_size=4, batch_size=32, flush_interval=0.05,
+                 busy_timeout=5.0, delta_channels=("messages", "content"), snapshot_every=16, cache_size=256,
+                 serde=None):
+        super().__init__(serde=serde)
+        if path == ":memory:" or path.startswith("file::memory:"):
+            raise ValueError("PooledSqliteSaver needs a file, use SqliteSaver for an in-memory database")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.busy_timeout = busy_timeout
+        self.delta_channels = tuple(delta_channels)
+        self.snapshot_every = snapshot_every
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # (thread_id, thread_ts) -> (depth, {channel: tuple of items})
+        self.cache_lock = threading.Lock()
+        self.writer = self._connect()
+        self.writer.executescript("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                thread_ts TEXT NOT NULL,
+                parent_ts TEXT,
+                checkpoint BLOB,
+                metadata BLOB,
+                PRIMARY KEY (thread_id, thread_ts)
+            );
+        """)
+        # number of deltas since the last full snapshot, 0 for a full checkpoint (also in older files)
+        columns = {row[1] for row in self.writer.execute("PRAGMA table_info(checkpoints)")}
+        if "depth" not in columns:
+            self.writer.execute("ALTER TABLE checkpoints ADD COLUMN depth INTEGER NOT NULL DEFAULT 0")
+            self.writer.commit()
+        # unix time of the write, for the idle_ttl of retention
+        if "created_at" not in columns:
+            self.writer.execute("ALTER TABLE checkpoints ADD COLUMN created_at REAL")
+            self._backfill_created_at()
+        self.write_lock = threading.Lock()
+        self.pending = 0
+        self.pending_threads = set()
+        self.first_pending = None
+        self.counters = {"writes": 0, "commits": 0, "reads": 0}
+        self.readers = queue.LifoQueue()
+        for _ in range(pool_size):
+            self.readers.put(None)  # connected on first use
+        self.closed = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_loop, name="checkpoint-flush", daemon=True)
+        self.flusher.start()
+        self.retention = None
+
+    def _backfill_created_at(self, batch=500):
+        # rows written before the column existed: the "ts" of the checkpoint (not delta-encoded)
+        while True:
+            rows = self.writer.execute("SELECT thread_id, thread_ts, checkpoint FROM checkpoints "
+                                       "WHERE created_at IS NULL LIMIT ?", (batch,)).fetchall()
+            if not rows:
+                break
+            self.writer.executemany(
+                "UPDATE checkpoints SET created_at = ? WHERE thread_id = ? AND thread_ts = ?",
+                [(datetime.fromisoformat(self.serde.loads(blob)["ts"]).timestamp(), thread_id, thread_ts)
+                 for thread_id, thread_ts, blob in rows])
+            self.writer.commit()
+
+    @classmethod
+    def from_conn_string(cls, path, **kwargs):
+        return cls(path, **kwargs)
+
+    def _connect(self, readonly=False):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.executescript(PRAGMAS)
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.flusher.join()
+        if self.retention is not None:
+            self.retention.join()
+        with self.write_lock:
+            self._commit()
+            self.writer.close()
+        while not self.readers.empty():
+            conn = self.readers.get_nowait()
+            if conn is not None:
+                conn.close()
+
+    # writes
+
+    def _commit(self):
+        # with write_lock held
+        if self.pending:
+            self.writer.commit()
+            self.counters["commits"] += 1
+            self.pending = 0
+            self.pending_threads.clear()
+            self.first_pending = None
+
+    def flush(self, thread_id=None):
+        """Commit the pending writes (if thread_id is given: only if some of them are of this thread)"""
+        if self.pending and (thread_id is None or thread_id in self.pending_threads):
+            with self.write_lock:
+                self._commit()
+
+    def _flush_loop(self):
+        while not self.closed.wait(self.flush_interval):
+            if self.first_pending is not None and time.monotonic() - self.first_pending >= self.flush_interval:
+                self.flush()
+
+    def put(self, config, checkpoint, metadata):
+        thread_id = config["configurable"]["thread_id"]
+        parent_ts = config["configurable"].get("thread_ts")
+        stored, depth = self._encode(str(thread_id), parent_ts, checkpoint)
+        # serialized outside the lock, so concurrent writers only wait for the INSERT itself:
+        row = (str(thread_id), checkpoint["id"], parent_ts, self.serde.dumps(stored), self.serde.dumps(metadata), depth,
+               time.time())
+        with self.write_lock:
+            self.writer.execute("INSERT OR REPLACE INTO checkpoints "
+                                "(thread_id, thread_ts, parent_ts, checkpoint, metadata, depth, created_at) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+            self.counters["writes"] += 1
+            self.pending += 1
+            self.pending_threads.add(row[0])
+            if self.first_pending is None:
+                self.first_pending = time.monotonic()
+            if self.pending >= self.batch_size:
+                self._commit()
+        return {"configurable": {"thread_id": thread_id, "thread_ts": checkpoint["id"]}}
+
+    # deltas
+
+    def _remember(self, thread_id, thread_ts, depth, values):
+        lists = {ch: tuple(values[ch]) for ch in self.delta_channels if isinstance(values.get(ch), list)}
+        with self.cache_lock:
+            self.cache[thread_id, thread_ts] = (depth, lists)
+            self.cache.move_to_end((thread_id, thread_ts))
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return depth, lists
+
+    def _encode(self, thread_id, parent_ts, checkpoint):
+        """(checkpoint to store, depth): the delta channels relative to the parent, if possible"""
+        values = checkpoint["channel_values"]
+        stored, depth = checkpoint, 0
+        if self.delta_channels and parent_ts:
+            parent = self._parent_lists(thread_id, parent_ts)
+            if parent is not None and parent[0] + 1 < self.snapshot_every:
+                encoded = dict(values)
+                for ch, old in parent[1].items():
+                    new = values.get(ch)
+                    # only if the parent's list is a prefix, i.e. the channel was only appended to:
+                    if (isinstance(new, list) and len(new) >= len(old)
+                            and all(a is b or a == b for a, b in zip(old, new))):
+                        encoded[ch] = {DELTA_KEY: [len(old), new[len(old):]]}
+                        depth = parent[0] + 1
+                if depth:
+                    stored = dict(checkpoint, channel_values=encoded)
+        self._remember(thread_id, checkpoint["id"], depth, values)
+        return stored, depth
+
+    def _parent_lists(self, thread_id, thread_ts, conn=None, rows=None):
+        """(depth, {channel: items}) of a stored checkpoint, None if there is none"""
+        with self.cache_lock:
+            cached = self.cache.get((thread_id, thread_ts))
+            if cached is not None:
+                self.cache.move_to_end((thread_id, thread_ts))
+                return cached
+        row = rows.get(thread_ts) if rows else None
+        if row is None:
+            if conn is None:
+                with self._reader(thread_id) as conn:
+                    return self._parent_lists(thread_id, thread_ts, conn)
+            row = conn.execute("SELECT thread_id, thread_ts, parent_ts, checkpoint, metadata, depth FROM checkpoints "
+                               "WHERE thread_id = ? AND thread_ts = ?", (thread_id, thread_ts)).fetchone()
+            if row is None:
+                return None
+        return self._decode(row, conn, rows)[1]
+
+    def _decode(self, row, conn, rows=None):
+        """(checkpoint, cache entry) of a row, delta channels put back together from the parent's lists"""
+        thread_id, thread_ts, parent_ts, blob, _, depth = row
+        checkpoint = self.serde.loads(blob)
+        if depth:
+            values = checkpoint["channel_values"]
+            parent = self._parent_lists(thread_id, parent_ts, conn, rows)
+            if parent is None:
+                raise LookupError("checkpoint {} of thread {} is a delta of {}, which is missing".format(
+                    thread_ts, thread_id, parent_ts))
+            for ch, value in values.items():
+                if isinstance(value, dict) and DELTA_KEY in value:
+                    start, items = value[DELTA_KEY]
+                    values[ch] = list(parent[1][ch][:start]) + items
+        return checkpoint, self._remember(thread_id, thread_ts, depth, checkpoint["channel_values"])
+
+    # reads
+
+    @contextmanager
+    def _reader(self, thread_id=None):
+        self.flush(thread_id)
+        conn = self.readers.get()
+        try:
+            if conn is None:
+                conn = self._connect(readonly=True)
+            yield conn
+        finally:
+            self.readers.put(conn)
+            self.counters["reads"] += 1
+
+    def _tuple(self, row, conn, rows=None, thread_id=None):
+        thread_id = row[0] if thread_id is None else thread_id
+        thread_ts, parent_ts, metadata = row[1], row[2], row[4]
+        return CheckpointTuple(
+            {"configurable": {"thread_id": thread_id, "thread_ts": thread_ts}},
+            self._decode(row, conn, rows)[0],
+            self.serde.loads(metadata) if metadata is not None else {},
+            {"configurable": {"thread_id": thread_id, "thread_ts": parent_ts}} if parent_ts else None)
+
+    def get_tuple(self, config):
+        thread_id = str(config["configurable"]["thread_id"])
+        thread_ts = config["configurable"].get("thread_ts")
+        with self._reader(thread_id) as conn:
+            if thread_ts:
+                row = conn.execute("SELECT thread_id, thread_ts, parent_ts, checkpoint, metadata, depth FROM checkpoints "
+                                   "WHERE thread_id = ? AND thread_ts = ?", (thread_id, str(thread_ts))).fetchone()
+            else:
+                row = conn.execute("SELECT thread_id, thread_ts, parent_ts, checkpoint, metadata, depth FROM checkpoints "
+                                   "WHERE thread_id = ? ORDER BY thread_ts DESC LIMIT 1", (thread_id,)).fetchone()
+            if row is None:
+                return None
+            # with thread_ts: the thread_id as given (SqliteSaver does the same)
+            return self._tuple(row, conn, thread_id=config["configurable"]["thread_id"] if thread_ts else None)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        # SQLite can only filter JSON metadata (json_extract), other serializers are filtered here
+        sql_filter = isinstance(self.serde, JsonPlusSerializer)
+        where, params = search_where(config, filter if sql_filter else None, before)
+        query = ("SELECT thread_id, thread_ts, parent_ts, checkpoint, metadata, depth FROM checkpoints {} "
+                 "ORDER BY thread_ts DESC".format(where))
+        if limit and (sql_filter or not filter):
+            query += " LIMIT {:d}".format(int(limit))
+        # decoded before the first yield, so a slow consumer doesn't hold a reader; the rows are
+        # newest first, the parents of deltas are mostly among them (and then cached):
+        with self._reader(str(config["configurable"]["thread_id"]) if config is not None else None) as conn:
+            rows = conn.execute(query, params).fetchall()
+            by_ts = {row[1]: row for row in rows} if config is not None else None
+            tuples = [self._tuple(row, conn, by_ts) for row in rows]
+        if filter and not sql_filter:
+            tuples = [t for t in tuples if all(t.metadata.get(k) == v for k, v in filter.items())][:limit or None]
+        yield from tuples
+
+    def thread_ids(self):
+        """Ids of all threads that have checkpoints"""
+        with self._reader() as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT thread_id FROM checkpoints")]
+
+    get_next_version = SqliteSaver.get_next_version
+
+    # async: the same calls in the default executor, so the event loop isn't blocked by SQLite
+
+    async def aget_tuple(self, config):
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        rows = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for row in rows:
+            yield row
+
+    async def aput(self, config, checkpoint, metadata):
+        return await asyncio.get_running_loop().run_in_executor(None, self.put, config, checkpoint, metadata)
+
+    # retention
+
+    def apply_retention(self, policy, dry_run=False, now=None):
+        """Delete the checkpoints policy doesn't keep, return a report (with dry_run: delete nothing)
+
+        Kept delta checkpoints whose parent is deleted are rewritten as full checkpoints first.
+        Every thread is done in one transaction, puts of other threads go on in between.
+        """
+        now = time.time() if now is None else now
+        report = {"dry_run": dry_run, "threads": 0, "expired_threads": [], "deleted": 0, "kept": 0,
+                  "rewritten": 0, "bytes": 0, "by_thread": {}}
+        for thread_id in self.thread_ids():
+            if self.closed.is_set():
+                break
+            self._retain_thread(thread_id, policy, dry_run, now, report)
+        return report
+
+    def _retain_thread(self, thread_id, policy, dry_run, now, report):
+        with self.write_lock:
+            self._commit()
+            conn = self.writer
+            rows = conn.execute("SELECT thread_ts, parent_ts, metadata, depth, created_at, "
+                                "LENGTH(checkpoint) + LENGTH(metadata) FROM checkpoints "
+                                "WHERE thread_id = ? ORDER BY thread_ts DESC", (thread_id,)).fetchall()
+            if not rows:
+                return
+            report["threads"] += 1
+            expired = policy.idle_ttl is not None and now - max(row[4] or 0 for row in rows) > policy.idle_ttl
+            if expired:
+                keep = set()
+                report["expired_threads"].append(thread_id)
+            else:
+                keep = policy.keep([(ts, parent_ts, self.serde.loads(metadata) if metadata is not None else {})
+                                    for ts, parent_ts, metadata, _, _, _ in rows])
+            delete = [row for row in rows if row[0] not in keep]
+            deleted = {row[0] for row in delete}
+            # deltas of a deleted checkpoint can't be read anymore, they become full checkpoints:
+            rewrite = [row[0] for row in rows if row[0] in keep and row[3] and row[1] in deleted]
+            report["deleted"] += len(delete)
+            report["kept"] += len(rows) - len(delete)
+            report["rewritten"] += len(rewrite)
+            report["bytes"] += sum(row[5] or 0 for row in delete)
+            if delete:
+                report["by_thread"][thread_id] = {"deleted": len(delete), "kept": len(rows) - len(delete),
+                                                  "rewritten": len(rewrite), "expired": expired}
+            if dry_run or not delete:
+                return
+            for ts in rewrite:
+                row = conn.execute("SELECT thread_id, thread_ts, parent_ts, checkpoint, metadata, depth FROM checkpoints "
+                                   "WHERE thread_id = ? AND thread_ts = ?", (thread_id, ts)).fetchone()
+                checkpoint = self._decode(row, conn)[0]
+                conn.execute("UPDATE checkpoints SET checkpoint = ?, depth = 0 WHERE thread_id = ? AND thread_ts = ?",
+                             (self.serde.dumps(checkpoint), thread_id, ts))
+            conn.executemany("DELETE FROM checkpoints WHERE thread_id = ? AND thread_ts = ?",
+                             [(thread_id, ts) for ts in deleted])
+            conn.commit()
+            self.counters["commits"] += 1
+        with self.cache_lock:
+            for ts in deleted:
+                self.cache.pop((thread_id, ts), None)
+
+    def vacuum(self, pages=1000):
+        """Give up to pages free pages back to the file system and truncate the WAL, return how many were freed
+
+        Pages are only freed for files with auto_vacuum=INCREMENTAL (new files; see enable_incremental_vacuum()).
+        """
+        with self.write_lock:
+            self._commit()
+            freed = 0
+            if self.writer.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                before = self.writer.execute("PRAGMA freelist_count").fetchone()[0]
+                # frees one page per step, and execute() would only step once:
+                self.writer.executescript("PRAGMA incremental_vacuum({:d});".format(int(pages)))
+                freed = before - self.writer.execute("PRAGMA freelist_count").fetchone()[0]
+            # the file only shrinks once the WAL is checkpointed, and the -wal file only with TRUNCATE
+            # (which waits up to busy_timeout for readers to finish)
+            self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            return freed
+
+    def enable_incremental_vacuum(self):
+        """Switch a file created without auto_vacuum to incremental vacuum (one full VACUUM, rewrites the file)"""
+        with self.write_lock:
+            self._commit()
+            self.writer.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self.writer.execute("VACUUM")
+
+    def start_retention(self, policy, interval=3600, vacuum_pages=1000):
+        """Apply policy now and then every interval seconds in a background thread, each time
+        followed by vacuum(vacuum_pages); the last report is in last_retention"""
+        if self.retention is not None:
+            raise RuntimeError("retention is already running")
+        self.last_retention = None
+
+        def loop():
+            while not self.closed.is_set():
+                try:
+                    report = self.apply_retention(policy)
+                    report["vacuumed_pages"] = self.vacuum(vacuum_pages)
+                    self.last_retention = report
+                except Exception as e:  # keep running, e.g. after a busy timeout
+                    self.last_retention = {"error": repr(e)}
+                if self.closed.wait(interval):
+                    break
+        self.retention = threading.Thread(target=loop, name="checkpoint-retention", daemon=True)
+        self.retention.start()
+
+    def stats(self):
+        return dict(self.counters, pending=self.pending,
+                    size=sum(os.path.getsize(self.path + suffix) for suffix in ("", "-wal")
+                             if os.path.exists(self.path + suffix)))
+
+
+def _checkpoint(step, messages):
+    from langgraph.checkpoint.base import empty_checkpoint
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": messages}
+    checkpoint["channel_versions"] = {"messages": step}
+    return checkpoint
+
+
+def benchmark(threads=8, steps=200, path=None):
+    """Checkpoint writes and reads per second, SqliteSaver(":memory:") vs PooledSqliteSaver, with concurrent threads
+
+    write: every thread writes steps checkpoints of its own graph thread; read: every thread reads
+    them all back by thread_ts; agent: every thread reads the latest checkpoint and writes the
+    next one, like a graph step, while the other threads do the same.
+    """
+    import tempfile
+    from langchain_core.messages import AIMessage, HumanMessage
+    messages = [HumanMessage(content="What is the weather in SF?"), AIMessage(content="Sunny, 18°C. " * 20)]
+
+    def parallel(fn):
+        errors = []
+
+        def worker(i):
+            try:
+                fn(i)
+            except Exception as e:
+                errors.append(e)
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        if errors:
+            raise errors[0]
+        return threads * steps / (time.perf_counter() - start)
+
+    def run(saver):
+        configs = {}
+
+        def write(i):
+            config = {"configurable": {"thread_id": "w{}".format(i)}}
+            configs[i] = []
+            for step in range(steps):
+                config = saver.put(config, _checkpoint(step, messages), {"source": "loop", "step": step})
+                configs[i].append(config)
+
+        def read(i):
+            for config in configs[i]:
+                assert saver.get_tuple(config) is not None
+
+        def agent(i):
+            config = {"configurable": {"thread_id": "a{}".format(i)}}
+            for step in range(steps):
+                latest = saver.get_tuple({"configurable": {"thread_id": "a{}".format(i)}})
+                assert step == 0 or latest.config == config
+                config = saver.put(config, _checkpoint(step, messages), {"source": "loop", "step": step})
+        return parallel(write), parallel(read), parallel(agent)
+
+    path = path or os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite")
+    print("{} threads x {} checkpoints".format(threads, steps))
+    print("    {:<26} {:>10} {:>10} {:>14}".format("", "writes/s", "reads/s", "agent steps/s"))
+    pooled = PooledSqliteSaver(path)
+    for label, saver in [("SqliteSaver(':memory:')", SqliteSaver.from_conn_string(":memory:")),
+                         ("PooledSqliteSaver (file)", pooled)]:
+        print("    {:<26} {:10.0f} {:10.0f} {:14.0f}".format(label, *run(saver)))
+    # everything is in the file, also for a new process:
+    pooled.close()
+    with PooledSqliteSaver(path) as reopened:
+        for i in range(threads):
+            assert len(list(reopened.list({"configurable": {"thread_id": "w{}".format(i)}}))) == steps
+        print("    reopened: {}".format(reopened.stats()))
+
+
+def benchmark_deltas(steps=200, snapshot_every=16):
+    """Bytes written per step and read times for a thread of steps agent steps, full vs delta checkpoints"""
+    import tempfile
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+    def message(step):
+        if step % 3 == 0:
+            return HumanMessage(content="What's the weather in city {}? ".format(step) * 3)
+        if step % 3 == 1:
+            return AIMessage(content="", tool_calls=[{"name": "tavily_search_results_json", "id": "call_{}".format(step),
+                                                      "args": {"query": "weather in city {}".format(step)}}])
+        return ToolMessage(content="{'location': {'name': 'City'}, 'current': {'temp_c': 12.8}} " * 10,
+                           tool_call_id="call_{}".format(step - 1))
+
+    def run(saver, conn):
+        config = {"configurable": {"thread_id": "long"}}
+        messages = []
+        start = time.perf_counter()
+        for step in range(steps):
+            messages = messages + [message(step)]
+            config = saver.put(config, _checkpoint(step, messages),
+                               {"source": "loop", "step": step, "writes": {"agent": {"messages": messages[-1:]}}})
+        write = (time.perf_counter() - start) / steps
+        if hasattr(saver, "flush"):
+            saver.flush()
+            saver.cache.clear()  # reads as after a restart
+        size = conn().execute("SELECT SUM(LENGTH(checkpoint) + LENGTH(metadata)) FROM checkpoints").fetchone()[0]
+        start = time.perf_counter()
+        latest = saver.get_tuple({"configurable": {"thread_id": "long"}})
+        latest_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        history = list(saver.list({"configurable": {"thread_id": "long"}}))
+        history_ms = (time.perf_counter() - start) * 1000
+        assert latest.checkpoint["channel_values"]["messages"] == messages and len(history) == steps
+        return size / steps, write * 1000, latest_ms, history_ms
+
+    directory = tempfile.mkdtemp()
+    memory = SqliteSaver.from_conn_string(":memory:")
+    full = PooledSqliteSaver(os.path.join(directory, "full.sqlite"), delta_channels=())
+    delta = PooledSqliteSaver(os.path.join(directory, "delta.sqlite"), snapshot_every=snapshot_every)
+    savers = [("SqliteSaver(':memory:')", memory, lambda: memory.conn),
+              ("PooledSqliteSaver, full", full, lambda: full.writer),
+              ("PooledSqliteSaver, deltas (K={})".format(snapshot_every), delta, lambda: delta.writer)]
+    try:
+        from checkpoint_serde import CompactSerializer
+        compact = PooledSqliteSaver(os.path.join(directory, "compact.sqlite"), snapshot_every=snapshot_every,
+                                    serde=CompactSerializer(level=3))
+        savers.append(("  + msgpack/zstd (checkpoint_serde)", compact, lambda: compact.writer))
+    except ImportError:  # no msgpack
+        pass
+    print("one thread of {} steps, one message per step".format(steps))
+    print("    {:<34} {:>12} {:>10} {:>12} {:>14}".format("", "bytes/step", "ms/write", "latest (ms)", "history (ms)"))
+    for label, saver, conn in savers:
+        print("    {:<34} {:12.0f} {:10.2f} {:12.2f} {:14.1f}".format(label, *run(saver, conn)))
+        if saver is not memory:
+            saver.close()
+
+
+def retention_demo(threads=20, steps=100):
+    """Dry run, then retention of threads of steps checkpoints (every 4th thread idle for two days)"""
+    import tempfile
+    from langchain_core.messages import HumanMessage
+    path = os.path.join(tempfile.mkdtemp(), "retention.sqlite")
+    with PooledSqliteSaver(path) as saver:
+        for i in range(threads):
+            config = {"configurable": {"thread_id": "thread-{}".format(i)}}
+            messages = []
+            for step in range(steps):
+                messages = messages + [HumanMessage(content="step {} ".format(step) * 50)]
+                config = saver.put(config, _checkpoint(step, messages), {"source": "loop", "step": step})
+            if i % 4 == 0:
+                saver.flush()
+                saver.writer.execute("UPDATE checkpoints SET created_at = created_at - 2 * 86400 WHERE thread_id = ?",
+                                     (config["configurable"]["thread_id"],))
+                saver.writer.commit()
+        policy = RetentionPolicy(keep_last=25, idle_ttl=86400)
+        for dry_run in (True, False):
+            start = time.perf_counter()
+            report = saver.apply_retention(policy, dry_run=dry_run)
+            print("{:<9} {:5.0f} ms: {} of {} checkpoints ({:.0f} KB), {} expired threads, {} deltas rewritten".format(
+                "dry run" if dry_run else "retention", (time.perf_counter() - start) * 1000, report["deleted"],
+                report["deleted"] + report["kept"], report["bytes"] / 1024, len(report["expired_threads"]),
+                report["rewritten"]))
+        size = saver.stats()["size"]
+        pages = saver.vacuum(10 ** 6)
+        print("vacuum: {} pages freed, {:.0f} KB -> {:.0f} KB".format(pages, size / 1024, saver.stats()["size"] / 1024))
+        assert saver.stats()["size"] < size and os.path.getsize(path + "-wal") == 0
+        latest = saver.get_tuple({"configurable": {"thread_id": "thread-1"}})
+        assert len(latest.checkpoint["channel_values"]["messages"]) == steps
+        assert len(list(saver.list({"configurable": {"thread_id": "thread-1"}}))) == 25
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark_deltas()
+    retention_demo()
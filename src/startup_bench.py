@@ -0,0 +1,97 @@
+# startup benchmark for the agent modules, based on `python -X importtime`:
+#
+#   python startup_bench.py                  -> import time of every module in BUDGETS, exit code 1 if over budget
+#   python startup_bench.py helper --top 15  -> the 15 slowest imports of helper
+#
+# Each module is imported in a fresh interpreter, so nothing is cached between measurements.
+# Besides the time budget, a module fails when it imports one of its FORBIDDEN modules
+# (e.g. a headless worker that only needs ewriter must not pull in gradio).
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+
+# module -> import time budget in ms (cumulative, as reported by -X importtime)
+BUDGETS = {
+    "helper": 1500,
+    "agent_tools": 1500,
+    "agent_graph": 2000,
+    "graph_metrics": 1000,
+    "message_log": 100,
+}
+FORBIDDEN = {
+    "helper": ("gradio", "langchain_openai", "tavily", "IPython"),
+    "agent_graph": ("gradio", "IPython"),
+}
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(module, runs=3):
+    """[(module, self_us, cumulative_us, depth)] of the fastest of `runs` imports of module
+
+    Only module and what it imports, not the interpreter startup (site, .pth files).
+    Children are reported before their parent, so module's imports are the rows before its own.
+    """
+    best = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                                cwd=SRC, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError("import {} failed:\n{}".format(module, result.stderr[-2000:]))
+        rows = []
+        for line in result.stderr.splitlines():
+            match = _LINE_RE.match(line)
+            if match:
+                rows.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+        end = max((i for i, r in enumerate(rows) if r[0] == module and r[3] == 0), default=None)
+        if end is None:
+            # e.g. a module the interpreter imports at startup, or a typo that -c happens to survive
+            raise RuntimeError("-X importtime reported no import of {} (already imported at startup?)".format(module))
+        start = end
+        while start > 0 and rows[start - 1][3] > 0:
+            start -= 1
+        rows = rows[start:end + 1]
+        if best is None or rows[-1][2] < best[-1][2]:
+            best = rows
+    return best
+
+
+def check(module, budget_ms=None, top=5):
+    """Print the import time of module and its slowest imports, return the list of problems"""
+    rows = import_times(module)
+    total_ms = rows[-1][2] / 1000
+    imported = {name for name, _, _, _ in rows}
+    problems = []
+    if budget_ms is not None and total_ms > budget_ms:
+        problems.append("{}: {:.0f} ms > budget {} ms".format(module, total_ms, budget_ms))
+    for name in FORBIDDEN.get(module, ()):
+        if name in imported:
+            problems.append("{}: imports {}".format(module, name))
+    budget = " (budget {} ms)".format(budget_ms) if budget_ms is not None else ""
+    print("{:<16} {:8.1f} ms{}".format(module, total_ms, budget))
+    # slowest direct imports (depth 1: imported by the module itself)
+    direct = sorted((r for r in rows if r[3] == 1), key=lambda r: r[2], reverse=True)
+    for name, _, cumulative, _ in direct[:top]:
+        print("    {:<40} {:8.1f} ms".format(name, cumulative / 1000))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="*", help="modules to measure (default: all in BUDGETS)")
+    parser.add_argument("--top", type=int, default=5, help="number of slowest imports to show")
+    args = parser.parse_args(argv)
+    problems = []
+    for module in args.modules or BUDGETS:
+        problems += check(module, BUDGETS.get(module), top=args.top)
+    for problem in problems:
+        print("FAIL", problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# Tavily search results decoded once into small __slots__ records (Lessons 2, 3 and 4):
+# the weather results are the Python repr of a dict inside the `content` string, which
+# Lesson 3 turned into JSON with .replace("'", '"') (wrong as soon as a value contains an
+# apostrophe). parse_payload() tries json first and falls back to ast.literal_eval, identical
+# payloads (the same city asked again) are decoded only once, and the compact text of a
+# record is rendered once and then reused.
+import ast
+import json
+from functools import lru_cache
+
+_MISSING = object()
+
+
+def parse_payload(text):
+    """The dict in text (JSON or a Python dict repr), None if text isn't one"""
+    text = text.strip()
+    if not text.startswith("{"):
+        return None
+    try:
+        value = json.loads(text)
+    except ValueError:
+        try:
+            # literals only, never evaluates code:
+            value = ast.literal_eval(text)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return None
+    return value if isinstance(value, dict) else None
+
+
+class _Record:
+    """Known fields as slots, anything else in extra; to_dict() gives the payload back in its order"""
+    __slots__ = ("extra", "_order")
+    FIELDS = ()
+
+    def __init__(self, data):
+        extra = None
+        for key, value in data.items():
+            if key in self.FIELDS:
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        for key in self.FIELDS:
+            if key not in data:
+                setattr(self, key, None)
+        self.extra = extra
+        self._order = tuple(data)
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return (self.extra or {}).get(key, default)
+
+    def to_dict(self):
+        return {key: self._value(key) for key in self._order}
+
+    def _value(self, key):
+        value = getattr(self, key) if key in self.FIELDS else self.extra[key]
+        return value.to_dict() if isinstance(value, _Record) else value
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, self.to_dict())
+
+
+class Location(_Record):
+    FIELDS = ("name", "region", "country", "lat", "lon", "tz_id", "localtime_epoch", "localtime")
+    __slots__ = FIELDS
+
+
+class Condition(_Record):
+    FIELDS = ("text", "icon", "code")
+    __slots__ = FIELDS
+
+
+class Current(_Record):
+    FIELDS = ("last_updated_epoch", "last_updated", "temp_c", "temp_f", "is_day", "condition",
+              "wind_mph", "wind_kph", "wind_degree", "wind_dir", "pressure_mb", "pressure_in",
+              "precip_mm", "precip_in", "humidity", "cloud", "feelslike_c", "feelslike_f",
+              "windchill_c", "windchill_f", "heatindex_c", "heatindex_f", "dewpoint_c", "dewpoint_f",
+              "vis_km", "vis_miles", "uv", "gust_mph", "gust_kph")
+    __slots__ = FIELDS
+
+    def __init__(self, data):
+        super().__init__(data)
+        if isinstance(self.condition, dict):
+            self.condition = Condition(self.condition)
+
+
+class Weather:
+    """A weatherapi.com payload as Tavily returns it for weather questions"""
+    __slots__ = ("location", "current", "extra", "_text")
+
+    def __init__(self, data):
+        self.location = Location(data.get("location") or {})
+        self.current = Current(data.get("current") or {})
+        extra = {k: v for k, v in data.items() if k not in ("location", "current")}
+        self.extra = extra or None
+        self._text = None
+
+    @classmethod
+    def parse(cls, content):
+        """Weather of a result's content, None if it isn't a weather payload (cached by content)"""
+        if not content.lstrip().startswith("{"):
+            return None
+        return _parse_weather(content)
+
+    def to_dict(self):
+        return dict(location=self.location.to_dict(), current=self.current.to_dict(), **(self.extra or {}))
+
+    def to_text(self):
+        """One line for the prompt, rendered once"""
+        if self._text is None:
+            location = self.location
+            current = self.current
+            place = ", ".join(str(v) for v in (location.name, location.region, location.country) if v)
+            parts = []
+            if current.condition is not None and current.condition.text:
+                parts.append(current.condition.text)
+            if current.temp_c is not None:
+                parts.append("{}°C ({}°F)".format(current.temp_c, current.temp_f))
+            if current.feelslike_c is not None:
+                parts.append("feels like {}°C".format(current.feelslike_c))
+            if current.wind_kph is not None:
+                parts.append("wind {} kph {}".format(current.wind_kph, current.wind_dir or "").strip())
+            if current.humidity is not None:
+                parts.append("humidity {}%".format(current.humidity))
+            if current.precip_mm is not None:
+                parts.append("precipitation {} mm".format(current.precip_mm))
+            self._text = "Weather in {} at {}: {}".format(place, location.localtime or "?", ", ".join(parts))
+        return self._text
+
+    def __repr__(self):
+        return "Weather({!r})".format(self.to_text())
+
+
+@lru_cache(maxsize=4096)
+def _parse_weather(content):
+    # the records are never modified, so the same one can be shared by every result with this content
+    data = parse_payload(content)
+    if data is None or not isinstance(data.get("current"), dict):
+        return None
+    return Weather(data)
+
+
+class TavilyResult:
+    """One search result; content is kept as it is, weather is decoded on first access"""
+    __slots__ = ("url", "title", "content", "score", "raw_content", "_weather", "_text", "_text_chars")
+
+    def __init__(self, url="", title="", content="", score=None, raw_content=None):
+        self.url = url
+        self.title = title
+        self.content = content
+        self.score = score
+        self.raw_content = raw_content
+        self._weather = _MISSING
+        self._text = None
+        self._text_chars = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("url", ""), data.get("title", ""), data.get("content", ""),
+                   data.get("score"), data.get("raw_content"))
+
+    @property
+    def weather(self):
+        if self._weather is _MISSING:
+            self._weather = Weather.parse(self.content) if isinstance(self.content, str) else None
+        return self._weather
+
+    @property
+    def key(self):
+        # the same page with another fragment or trailing slash is the same result
+        return self.url.split("#")[0].rstrip("/")
+
+    def to_dict(self):
+        data = {"url": self.url, "title": self.title, "content": self.content, "score": self.score}
+        if self.raw_content is not None:
+            data["raw_content"] = self.raw_content
+        return data
+
+    def to_text(self, max_chars=600):
+        """Weather condensed to one line, other content whitespace-collapsed and cut (rendered once)"""
+        if self._text is None or self._text_chars != max_chars:
+            weather = self.weather
+            if weather is not None:
+                text = weather.to_text()
+            else:
+                text = " ".join(str(self.content).split())
+                if len(text) > max_chars:
+                    text = text[:max_chars] + " ..."
+            self._text = "{} (source: {})".format(text, self.url)
+            self._text_chars = max_chars
+        return self._text
+
+    def __repr__(self):
+        return "TavilyResult({!r})".format(self.url)
+
+
+class TavilyResponse:
+    """The results of one search: TavilyClient.search() dicts or the list of the LangChain tool"""
+    __slots__ = ("query", "answer", "results", "_text", "_text_chars")
+
+    def __init__(self, results, query=None, answer=None):
+        self.results = results
+        self.query = query
+        self.answer = answer
+        self._text = None
+        self._text_chars = None
+
+    @classmethod
+    def parse(cls, payload):
+        if isinstance(payload, TavilyResponse):
+            return payload
+        if isinstance(payload, dict):
+            return cls([TavilyResult.from_dict(r) for r in payload.get("results", ())],
+                       payload.get("query"), payload.get("answer"))
+        if isinstance(payload, list):
+            return cls([TavilyResult.from_dict(r) for r in payload if isinstance(r, dict)])
+        raise TypeError("not a Tavily response: {}".format(type(payload).__name__))
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def to_text(self, max_chars=600):
+        """One line per result, duplicate URLs and contents dropped (rendered once)"""
+        if self._text is None or self._text_chars != max_chars:
+            seen = set()
+            lines = []
+            for r in self.results:
+                if r.key in seen or r.content in seen:
+                    continue
+                seen.update((r.key, r.content))
+                lines.append(r.to_text(max_chars))
+            self._text = "\n".join(lines)
+            self._text_chars = max_chars
+        return self._text
+
+
+def benchmark(n=20000, cities=50):
+    """Decoding and rendering n weather results (cities distinct payloads), Lesson 3 path vs records"""
+    import time
+    payloads = []
+    for i in range(cities):
+        payloads.append(str({
+            "location": {"name": "City {}".format(i), "region": "California", "country": "United States of America",
+                         "lat": 37.775, "lon": -122.4183, "tz_id": "America/Los_Angeles",
+                         "localtime_epoch": 1736026501, "localtime": "2025-01-04 13:35"},
+            "current": {"last_updated_epoch": 1736026200, "last_updated": "2025-01-04 13:30", "temp_c": 12.8,
+                        "temp_f": 55.0, "is_day": 1, "condition": {"text": "Partly cloudy", "icon": "//x.png", "code": 1003},
+                        "wind_kph": 7.2, "wind_dir": "N", "humidity": 77, "precip_mm": 0.0, "feelslike_c": 12.4}}))
+    results = [[{"url": "https://www.weatherapi.com/", "title": "Weather", "content": payloads[i % cities], "score": 0.9}]
+               for i in range(n)]
+
+    def lesson_3():
+        for result in results:
+            str(json.loads(result[0]["content"].replace("'", '"')))
+
+    def records():
+        for result in results:
+            TavilyResponse.parse(result).to_text()
+
+    _parse_weather.cache_clear()
+    for label, fn in [("json.loads(.replace) + str()", lesson_3), ("TavilyResponse.parse().to_text()", records)]:
+        start = time.perf_counter()
+        fn()
+        print("{:<34} {:8.2f} µs per result".format(label, (time.perf_counter() - start) / n * 1e6))
+
+    # an apostrophe breaks the .replace() path, not parse_payload():
+    tricky = ast.literal_eval(payloads[0])
+    tricky["current"]["condition"]["text"] = "Ain't cloudy"
+    tricky = str(tricky)
+    assert Weather.parse(tricky).current.condition.text == "Ain't cloudy"
+    assert Weather.parse(payloads[0]).to_dict() == ast.literal_eval(payloads[0])
+
+
+if __name__ == "__main__":
+    benchmark()
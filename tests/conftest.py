@@ -0,0 +1,5 @@
+# the modules live flat in src/ next to the lesson scripts, which import them the same way
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,55 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from agent_graph import AgentSpec, AgentTemplate, CascadeRouter, _pop_prefetched, _stream_with_tools
+from message_log import MessageLog
+
+
+@tool
+def lookup(query: str) -> str:
+    """Look something up"""
+    return "found " + query
+
+
+def answers():
+    call = AIMessage(content="", tool_calls=[{"name": "lookup", "args": {"query": "x"}, "id": "call_1"}])
+    return FakeMessagesListChatModel(responses=[call, AIMessage(content="done"), AIMessage(content="again")])
+
+
+def test_checkpointed_template():
+    template = AgentTemplate(checkpointer=SqliteSaver.from_conn_string(":memory:"))
+    abot = template.agent(answers(), [lookup], system="be brief")
+    thread = {"configurable": {"thread_id": "1"}}
+    abot.graph.invoke({"messages": [HumanMessage(content="q1")]}, thread)
+    state = abot.graph.invoke({"messages": [HumanMessage(content="q2")]}, thread)
+    assert [m.content for m in state["messages"]] == ["q1", "", "found x", "done", "q2", "again"]
+    saved = abot.graph.get_state(thread).values["messages"]
+    assert isinstance(saved, MessageLog) and list(saved) == list(state["messages"])
+
+
+def test_router_with_list_content():
+    router = CascadeRouter(None, None, {})
+    blocks = [{"type": "text", "text": "result"}]
+    assert router.before([HumanMessage(content=blocks), ToolMessage(content=blocks, tool_call_id="1")]) is None
+    assert router.before([HumanMessage(content="q"), ToolMessage(content="error: timeout", tool_call_id="1")]) \
+        == "failed tool call"
+
+
+class ModelStarts(BaseCallbackHandler):
+    def __init__(self):
+        self.tags = []
+
+    def on_chat_model_start(self, serialized, messages, tags=None, **kwargs):
+        self.tags.append(tags)
+
+
+def test_streamed_calls_get_the_config():
+    starts = ModelStarts()
+    spec = AgentSpec(answers(), [lookup], stream_tools=True)
+    message = _stream_with_tools(spec, [HumanMessage(content="q")], {"callbacks": [starts], "tags": ["t"]})
+    assert message.tool_calls[0]["name"] == "lookup"
+    assert starts.tags == [["t"]]
+    _pop_prefetched(message.tool_calls)
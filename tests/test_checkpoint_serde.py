@@ -0,0 +1,57 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from langgraph.checkpoint.sqlite import JsonPlusSerializerCompat
+
+pytest.importorskip("msgpack")
+from checkpoint_serde import CompactSerializer, _sample_checkpoint, train_dictionary  # noqa: E402
+
+
+def serializers():
+    yield pytest.param(CompactSerializer(level=None), id="raw")
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return
+    yield pytest.param(CompactSerializer(level=3, min_size=0), id="zstd")
+    dictionary = train_dictionary([_sample_checkpoint(i) for i in range(200)], size=8 * 1024)
+    yield pytest.param(CompactSerializer(level=3, min_size=0, dictionary=dictionary), id="zstd+dictionary")
+
+
+@pytest.fixture(params=list(serializers()))
+def serde(request):
+    return request.param
+
+
+@pytest.mark.parametrize("value", [
+    2 ** 64, -2 ** 63 - 1, 2 ** 1000, -(10 ** 30), 2 ** 64 - 1, -2 ** 63, 0, True,
+    {"counts": [2 ** 70, 1, {"nested": -2 ** 80}], 2 ** 65: "key"},
+])
+def test_ints_round_trip(serde, value):
+    loaded = serde.loads(serde.dumps(value))
+    assert loaded == value and type(loaded) is type(value)
+
+
+def test_checkpoint_round_trip(serde):
+    checkpoint = _sample_checkpoint(3)
+    checkpoint["channel_values"]["id"] = uuid.UUID(int=2 ** 100)
+    checkpoint["channel_values"]["when"] = datetime(2025, 1, 4, 13, 35, tzinfo=timezone.utc)
+    checkpoint["channel_values"]["tags"] = {"a", "b"}
+    checkpoint["channel_values"]["big"] = 3 ** 100
+    assert serde.loads(serde.dumps(checkpoint)) == checkpoint
+
+
+def test_legacy_json_stays_readable(serde):
+    checkpoint = _sample_checkpoint(1)
+    assert serde.loads(JsonPlusSerializerCompat().dumps(checkpoint)) == checkpoint
+
+
+def test_unknown_dictionary():
+    pytest.importorskip("zstandard")
+    dictionary = train_dictionary([_sample_checkpoint(i) for i in range(200)], size=8 * 1024)
+    checkpoint = _sample_checkpoint(0)
+    blob = CompactSerializer(dictionary=dictionary, min_size=0).dumps(checkpoint)
+    with pytest.raises(ValueError):
+        CompactSerializer().loads(blob)
+    assert CompactSerializer(old_dictionaries=[dictionary]).loads(blob) == checkpoint
@@ -0,0 +1,42 @@
+import pytest
+
+import context_window
+
+
+class FlakyTiktoken:
+    """Fails to load its encodings `failures` times, then works"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.loads = 0
+
+    def encoding_for_model(self, model):
+        self.loads += 1
+        if self.loads <= self.failures:
+            raise OSError("offline")
+        return FakeEncoding()
+
+
+class FakeEncoding:
+    def encode(self, text):
+        return text.split()
+
+
+@pytest.fixture
+def flaky(monkeypatch):
+    monkeypatch.setattr(context_window, "_encodings", {})
+    monkeypatch.setattr(context_window, "_failed", {})
+    tiktoken = FlakyTiktoken(failures=1)
+    monkeypatch.setattr(context_window, "tiktoken", tiktoken)
+    return tiktoken
+
+
+def test_failed_encoding_load_is_retried(flaky, monkeypatch):
+    text = "one two three four five six seven eight"
+    assert context_window.count_tokens(text) == len(text) // 4 + 1  # estimate while offline
+    assert context_window.count_tokens(text) == len(text) // 4 + 1  # no retry before RETRY_AFTER
+    assert flaky.loads == 1
+    monkeypatch.setattr(context_window, "RETRY_AFTER", 0)
+    assert context_window.count_tokens(text) == 8
+    context_window.count_tokens(text)
+    assert flaky.loads == 2  # the loaded encoding is kept
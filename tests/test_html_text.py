@@ -0,0 +1,23 @@
+import pytest
+
+from html_text import TextExtractor, extract_text
+
+
+@pytest.mark.parametrize("html, text", [
+    ("<div class='ad'><div><p>ad</p></div></div><p>after</p>", "after"),
+    # an ad without its </div> ends with its parent, or at the end of the body:
+    ("<section><div class='ad'><p>ad</section><p>kept</p>", "kept"),
+    ("<div><div class='ad'><p>ad</div><p>inside</p></div><p>after</p>", "inside\nafter"),
+    ("<body><div id='sponsored'><p>ad</body><p>tail</p>", "tail"),
+    # </head> is optional:
+    ("<html><head><title>t</title><body><h1>Title</h1><p>text</p></body></html>", "Title\ntext"),
+    ("<p>a<p>b<script>var p = '<p>x</p>';</script><p>c</p>", "a\nb\nc"),
+])
+def test_skipped_subtrees(html, text):
+    assert extract_text(html) == text
+
+
+def test_budget_stops_the_extractor():
+    extractor = TextExtractor(max_chars=10)
+    assert extractor.feed("<p>0123456</p><p>789abcdef</p><p>more</p>") == ["0123456", "789"]
+    assert extractor.done and extractor.text == "0123456\n789"
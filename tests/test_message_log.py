@@ -0,0 +1,63 @@
+from typing import Annotated, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import END, StateGraph
+
+from message_log import MessageLog, append_messages, compact_append_messages, with_system
+
+
+def test_append_shares_the_buffer_and_branches_copy():
+    a = MessageLog([HumanMessage(content="0")])
+    b = a.append([AIMessage(content="1")])
+    c = b.append([AIMessage(content="2")])
+    assert a._buffer is b._buffer is c._buffer
+    assert a == [HumanMessage(content="0")] and len(b) == 2 and len(c) == 3
+    branch = b.append([AIMessage(content="other")])  # c already appended to b's buffer
+    assert branch._buffer is not c._buffer
+    assert [m.content for m in branch] == ["0", "1", "other"] and [m.content for m in c] == ["0", "1", "2"]
+
+
+def test_with_system_doesnt_copy():
+    log = MessageLog([HumanMessage(content="hi")])
+    prompt = with_system("system", log)
+    assert list(prompt) == ["system", HumanMessage(content="hi")] and prompt.log is log
+
+
+def graph(reducer, checkpointer):
+    class State(TypedDict):
+        messages: Annotated[list[AnyMessage], reducer]
+
+    def llm(state):
+        return {"messages": [AIMessage(content="answer {}".format(len(state["messages"])))]}
+    builder = StateGraph(State)
+    builder.add_node("llm", llm)
+    builder.set_entry_point("llm")
+    builder.add_edge("llm", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def serializers():
+    yield None
+    try:
+        from checkpoint_serde import CompactSerializer
+    except ImportError:
+        return
+    yield CompactSerializer(level=None)
+
+
+@pytest.mark.parametrize("reducer", [append_messages, compact_append_messages])
+@pytest.mark.parametrize("serde", list(serializers()), ids=lambda s: type(s).__name__)
+def test_checkpointed_graph(reducer, serde):
+    saver = SqliteSaver.from_conn_string(":memory:")
+    if serde is not None:
+        saver.serde = serde
+    app = graph(reducer, saver)
+    thread = {"configurable": {"thread_id": "1"}}
+    app.invoke({"messages": [HumanMessage(content="q1")]}, thread)
+    state = app.invoke({"messages": [HumanMessage(content="q2")]}, thread)
+    assert [m.content for m in state["messages"]] == ["q1", "answer 1", "q2", "answer 3"]
+    saved = app.get_state(thread).values["messages"]
+    assert isinstance(saved, MessageLog) and list(saved) == list(state["messages"])
+    assert len(list(app.get_state_history(thread))) == 6
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from html_text import TextExtractor
+from page_fetcher import _demo_server, fetch_pages
+
+
+@pytest.fixture(scope="module")
+def base():
+    server = _demo_server()
+    yield "http://127.0.0.1:{}".format(server.server_address[1])
+    server.shutdown()
+
+
+def test_pages_come_back_in_the_order_they_finish(base):
+    urls = [base + "/page?delay={}&n={}".format(delay, i) for i, delay in enumerate([0.3, 0.1, 0.2])]
+    start = time.monotonic()
+    pages = fetch_pages(urls, per_host=10)
+    assert time.monotonic() - start < 0.55  # concurrently, not 0.6s one after the other
+    assert [page["url"] for page in pages] == [urls[1], urls[2], urls[0]]
+    assert all(page["status"] == 200 and page["error"] is None for page in pages)
+
+
+def test_duplicates_are_fetched_once(base):
+    assert len(fetch_pages([base + "/page"] * 3)) == 1
+
+
+def test_body_is_cut_at_max_bytes(base):
+    page, = fetch_pages([base + "/page?size=5000000"], max_bytes=100_000)
+    assert page["truncated"] and len(page["text"]) == 100_000
+
+
+def test_http_error_and_timeout_become_errors(base):
+    pages = fetch_pages([base + "/status?code=404", base + "/hang?delay=3"], read_timeout=0.5, total_timeout=1.0)
+    errors = {page["url"][len(base):]: page["error"] for page in pages}
+    assert errors == {"/status?code=404": "HTTP 404", "/hang?delay=3": "timed out"}
+
+
+@pytest.mark.parametrize("url", ["http://[::1", "ftp://example.com/", "", "http://exa mple.invalid/"])
+def test_bad_urls_become_errors(url):
+    page, = fetch_pages([url], connect_timeout=1.0, total_timeout=2.0)
+    assert page["error"] and page["status"] is None
+
+
+@pytest.mark.parametrize("charset", ["rot13", "hex", "base64", "zlib"])
+@pytest.mark.parametrize("extract", [None, TextExtractor])
+def test_charset_that_is_no_text_encoding_becomes_an_error(base, extract, charset):
+    page, = fetch_pages([base + "/page?charset=" + charset], extract=extract)
+    assert page["error"].startswith("LookupError")
+
+
+def test_extract_while_downloading(base):
+    page, = fetch_pages([base + "/page?size=5000000"], extract=lambda: TextExtractor(max_chars=1000))
+    assert page["text"].startswith("Page /page") and len(page["text"].replace("\n", "")) <= 1000
@@ -0,0 +1,56 @@
+import sqlite3
+import time
+
+import pytest
+
+from response_cache import LangChainCache, ResponseCache, _temperature, enable_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / "responses.sqlite"))
+
+
+def test_temperature_of_llm_strings():
+    ChatOpenAI = pytest.importorskip("langchain_openai").ChatOpenAI
+    assert _temperature(ChatOpenAI(model="gpt-4o", api_key="x")._get_llm_string()) == 0.7
+    assert _temperature(ChatOpenAI(model="gpt-4o", api_key="x", temperature=0)._get_llm_string()) == 0
+    # call parameters override the model's
+    assert _temperature(ChatOpenAI(model="gpt-4o", api_key="x")._get_llm_string(temperature=0)) == 0
+    assert _temperature("some model without parameters") is None
+
+
+def test_only_deterministic_requests_are_cached(cache):
+    lc = LangChainCache(cache)
+    for llm_string in ['{"temperature": 0.0}', '{"temperature": 0.7}', "no temperature"]:
+        lc.update("prompt", llm_string, [])
+    assert lc.lookup("prompt", '{"temperature": 0.0}') == []
+    assert lc.lookup("prompt", '{"temperature": 0.7}') is None
+    assert cache.stats()["entries"] == 1
+    assert LangChainCache(ResponseCache(path=cache.path, sampled=True)).lookup("prompt", '{"temperature": 0.7}') is None
+
+
+def test_expired_entries_are_deleted(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "responses.sqlite"), ttl=0.01)
+    cache.put("key", b"value")
+    time.sleep(0.05)
+    assert cache.get("key") is None
+    assert sqlite3.connect(cache.path).execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+
+
+@pytest.mark.parametrize("env", [{"RESPONSE_CACHE": "off"}, {"CASSETTE_MODE": "record"}])
+def test_enable_cache_is_off(monkeypatch, tmp_path, env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    assert enable_cache(path=str(tmp_path / "responses.sqlite")) is None
+
+
+def test_enable_cache(monkeypatch, tmp_path):
+    from langchain_core.globals import get_llm_cache, set_llm_cache
+    monkeypatch.delenv("RESPONSE_CACHE", raising=False)
+    monkeypatch.delenv("CASSETTE_MODE", raising=False)
+    try:
+        cache = enable_cache(path=str(tmp_path / "responses.sqlite"))
+        assert isinstance(get_llm_cache(), LangChainCache) and get_llm_cache().cache is cache
+    finally:
+        set_llm_cache(None)
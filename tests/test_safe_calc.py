@@ -0,0 +1,48 @@
+import pytest
+
+import safe_calc
+from safe_calc import calculate, evaluate_many
+
+
+def scalar(expression):
+    try:
+        return calculate(expression)
+    except (ValueError, ArithmeticError):
+        return "error"
+
+
+@pytest.mark.parametrize("expressions", [
+    ["7 // 2", "8 // 3", "2 ** 60 + 1", "3 ** 900 - 3 ** 900 + 1", "2 ** 62 * 4 // 2 ** 62", "1.5 * 2"],
+    ["round(7 / 2)", "round(5 / 2)", "round(7 / 3, 1)", "round(7)", "round(1e300)"],
+    ["round(7 / 2) * 0.5", "round(2.5) // 2", "round(1 / 3, 2) + 1"],
+    ["1 / 0", "2 + 3", "sqrt(-1)", "-7 % 3", "abs(-4)"],
+])
+def test_evaluate_many_matches_calculate(expressions):
+    results = evaluate_many(expressions, errors="nan")
+    for expression, value in zip(expressions, results):
+        expected = scalar(expression)
+        if expected == "error":
+            assert value != value, expression  # nan
+        else:
+            assert value == expected and type(value) is type(expected), expression
+
+
+def test_evaluate_many_raises_like_calculate():
+    with pytest.raises(ZeroDivisionError):
+        evaluate_many(["1 / 0", "2 + 3"])
+
+
+@pytest.mark.parametrize("expression", ["9 ** 9 ** 9", "(9 ** 999) ** 999", "((9 ** 999) ** 999) ** 999"])
+def test_huge_powers_are_rejected(expression):
+    with pytest.raises(ValueError):
+        calculate(expression)
+
+
+def test_observation_text_of_round():
+    assert str(evaluate_many(["round(7/2)"])[0]) == str(calculate("round(7/2)")) == "4"
+
+
+@pytest.mark.skipif(safe_calc.np is None, reason="needs numpy")
+def test_large_groups_are_vectorized():
+    expressions = ["{} * {} + round({} / 7)".format(i, i + 1, i) for i in range(1000)]
+    assert evaluate_many(expressions) == [calculate(e) for e in expressions]
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+from search_backends import DuckDuckGoBackend, HedgedSearch, LatencyHistogram, SearchBackend, SearchResult
+from search_cache import SearchCache
+
+
+class Backend(SearchBackend):
+    """Answers after delay seconds (or raises error), counts its calls"""
+
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def search(self, query, max_results=5):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return [SearchResult(query, "https://{}.example/".format(self.name), "", None, self.name)]
+
+
+def test_backends_must_implement_search():
+    with pytest.raises(TypeError):
+        SearchBackend()
+
+
+def test_fast_primary_is_not_hedged():
+    secondary = Backend("ddg")
+    hedged = HedgedSearch(Backend("tavily", 0.01), secondary, default_delay=0.5)
+    assert hedged.search("q")[0].backend == "tavily"
+    assert secondary.calls == 0
+    assert hedged.stats()["hedged"] == 0
+
+
+def test_slow_primary_is_hedged():
+    hedged = HedgedSearch(Backend("tavily", 1.0), Backend("ddg", 0.05), default_delay=0.1)
+    start = time.monotonic()
+    assert hedged.search("q")[0].backend == "ddg"
+    assert time.monotonic() - start < 0.5
+    stats = hedged.stats()
+    assert stats["hedged"] == 1 and stats["wins_ddg"] == 1
+
+
+def test_failed_primary_is_hedged_immediately():
+    hedged = HedgedSearch(Backend("tavily", error=RuntimeError("rate limited")), Backend("ddg"), default_delay=5.0)
+    start = time.monotonic()
+    assert hedged.search("q")[0].backend == "ddg"
+    assert time.monotonic() - start < 1.0
+    assert hedged.stats()["errors_tavily"] == 1
+
+
+def test_both_failing_raises_the_primary_error():
+    hedged = HedgedSearch(Backend("tavily", error=RuntimeError("primary")), Backend("ddg", error=RuntimeError("secondary")),
+                          default_delay=0.01)
+    with pytest.raises(RuntimeError, match="primary"):
+        hedged.search("q")
+
+
+def test_loser_that_has_not_started_is_cancelled():
+    # both workers blocked when the primary has answered: the hedge request is still queued
+    gate = threading.Event()
+    secondary = Backend("ddg")
+
+    class Primary(Backend):
+        def search(self, query, max_results=5):
+            hedged.pool.submit(gate.wait)  # the next free worker blocks on this, not the hedge request
+            return super().search(query, max_results)
+    hedged = HedgedSearch(Primary("tavily", 0.2), secondary, default_delay=0.05, max_workers=2)
+    hedged.pool.submit(gate.wait)
+    try:
+        assert hedged.search("q")[0].backend == "tavily"
+    finally:
+        gate.set()
+    hedged.pool.shutdown(wait=True)
+    assert secondary.calls == 0
+
+
+def test_hedge_delay_follows_the_primary_latency():
+    hedged = HedgedSearch(Backend("tavily", 0.02), Backend("ddg"), min_samples=5, default_delay=1.0, min_delay=0.001)
+    assert hedged.hedge_delay() == 1.0
+    for _ in range(5):
+        hedged.search("q")
+    assert 0.02 <= hedged.hedge_delay() < 0.05
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(0.5) is None
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    # bucket upper bounds: at most a factor BASE above the exact value
+    for q, exact in [(0.5, 0.050), (0.9, 0.090), (0.99, 0.099)]:
+        assert exact <= histogram.percentile(q) <= exact * LatencyHistogram.BASE
+    histogram.record(0)  # below MIN goes into the first bucket
+    assert histogram.count == 101
+
+
+def test_histogram_is_thread_safe():
+    histogram = LatencyHistogram()
+    threads = [threading.Thread(target=lambda: [histogram.record(0.01) for _ in range(1000)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert histogram.count == 8000
+
+
+def test_duckduckgo_through_a_search_cache(tmp_path):
+    calls = []
+
+    def text(query, max_results):
+        calls.append(query)
+        return [{"href": "https://example.com/", "title": "Example", "body": "..."}]
+    cache = SearchCache(text, path=str(tmp_path / "search.sqlite"), namespace="ddg.text")
+    backend = DuckDuckGoBackend(search=cache.search)
+    assert backend.search("q")[0].url == "https://example.com/"
+    assert backend.search("Q ")[0].title == "Example"
+    assert calls == ["q"]
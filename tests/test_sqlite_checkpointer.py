@@ -0,0 +1,261 @@
+import asyncio
+import operator
+import os
+import sqlite3
+import threading
+from typing import Annotated, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import END, StateGraph
+
+from sqlite_checkpointer import PooledSqliteSaver, RetentionPolicy, _checkpoint
+
+
+class State(TypedDict):
+    messages: Annotated[list[AnyMessage], operator.add]
+
+
+def graph(checkpointer):
+    def llm(state):
+        return {"messages": [AIMessage(content="answer {}".format(len(state["messages"])))]}
+
+    def tool(state):
+        return {"messages": [AIMessage(content="tool {}".format(len(state["messages"])))]}
+    builder = StateGraph(State)
+    builder.add_node("llm", llm)
+    builder.add_node("tool", tool)
+    builder.add_conditional_edges("llm", lambda state: not state["messages"][-2].content.startswith("tool"), {True: "tool", False: END})
+    builder.add_edge("tool", "llm")
+    builder.set_entry_point("llm")
+    return builder.compile(checkpointer=checkpointer)
+
+
+THREAD = {"configurable": {"thread_id": "1"}}
+
+
+def history(app, config=THREAD):
+    """The history without the (random) checkpoint ids: values, next nodes, metadata and parent position"""
+    states = list(app.get_state_history(config))
+    position = {s.config["configurable"]["thread_ts"]: i for i, s in enumerate(states)}
+    return [(s.values, s.next, s.metadata,
+             position.get(s.parent_config["configurable"]["thread_ts"]) if s.parent_config else None)
+            for s in states]
+
+
+def run(app):
+    for turn in range(3):
+        app.invoke({"messages": [HumanMessage(content="q{}".format(turn))]}, THREAD)
+    # a branch off an older checkpoint, continued from there
+    older = list(app.get_state_history(THREAD))[5].config
+    branch = app.update_state(older, {"messages": [HumanMessage(content="edited")]})
+    app.invoke(None, branch)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "checkpoints.sqlite")
+
+
+@pytest.mark.parametrize("delta_channels", [("messages",), ()])
+def test_history_like_sqlite_saver(path, delta_channels):
+    expected = graph(SqliteSaver.from_conn_string(":memory:"))
+    run(expected)
+    with PooledSqliteSaver(path, delta_channels=delta_channels, snapshot_every=3) as saver:
+        app = graph(saver)
+        run(app)
+        assert history(app) == history(expected)
+        if delta_channels:
+            depths = [row[0] for row in saver.writer.execute("SELECT depth FROM checkpoints")]
+            assert max(depths) == 2 and 0 in depths
+    # everything is in the file, also without the cache
+    with PooledSqliteSaver(path, delta_channels=delta_channels) as reopened:
+        assert history(graph(reopened)) == history(expected)
+
+
+def test_ainvoke_and_aget_state_history(path):
+    expected = graph(SqliteSaver.from_conn_string(":memory:"))
+    for turn in range(2):
+        expected.invoke({"messages": [HumanMessage(content="q{}".format(turn))]}, THREAD)
+
+    async def arun(app):
+        for turn in range(2):
+            await app.ainvoke({"messages": [HumanMessage(content="q{}".format(turn))]}, THREAD)
+        return [state async for state in app.aget_state_history(THREAD)], await app.aget_state(THREAD)
+
+    with PooledSqliteSaver(path, snapshot_every=4) as saver:
+        app = graph(saver)
+        states, latest = asyncio.run(arun(app))
+        assert [s.values for s in states] == [s.values for s in expected.get_state_history(THREAD)]
+        assert latest.values == expected.get_state(THREAD).values
+        assert history(app) == history(expected)
+
+
+def test_async_wrappers(path):
+    async def arun(saver):
+        config = {"configurable": {"thread_id": "a"}}
+        for step in range(3):
+            config = await saver.aput(config, _checkpoint(step, ["m"] * (step + 1)), {"step": step})
+        latest = await saver.aget_tuple({"configurable": {"thread_id": "a"}})
+        listed = [t async for t in saver.alist({"configurable": {"thread_id": "a"}}, limit=2)]
+        return config, latest, listed
+
+    with PooledSqliteSaver(path) as saver:
+        config, latest, listed = asyncio.run(arun(saver))
+        assert latest.config == config and latest.checkpoint["channel_values"]["messages"] == ["m"] * 3
+        assert [t.metadata["step"] for t in listed] == [2, 1]
+
+
+def test_reads_see_pending_writes(path):
+    with PooledSqliteSaver(path, batch_size=1000, flush_interval=60) as saver:
+        config = saver.put({"configurable": {"thread_id": "a"}}, _checkpoint(0, ["m"]), {})
+        assert saver.pending == 1
+        assert saver.get_tuple({"configurable": {"thread_id": "a"}}).config == config
+        assert saver.pending == 0 and saver.counters["commits"] == 1
+
+
+def test_reader_pool(path):
+    with PooledSqliteSaver(path, pool_size=2) as saver:
+        configs = []
+        config = {"configurable": {"thread_id": "a"}}
+        for step in range(20):
+            config = saver.put(config, _checkpoint(step, ["m"] * (step + 1)), {})
+            configs.append(config)
+        saver.flush()
+        errors = []
+
+        def read():
+            try:
+                for config in configs:
+                    assert saver.get_tuple(config).config == config
+            except Exception as e:
+                errors.append(e)
+        workers = [threading.Thread(target=read) for _ in range(8)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        assert not errors and saver.counters["reads"] >= 8 * 20
+        readers = [saver.readers.get_nowait() for _ in range(saver.readers.qsize())]
+        assert len(readers) == 2
+        connected = [conn for conn in readers if conn is not None]
+        assert connected
+        with pytest.raises(sqlite3.OperationalError):
+            connected[0].execute("DELETE FROM checkpoints")
+        for conn in readers:
+            saver.readers.put(conn)
+
+
+def test_in_memory_database_is_refused():
+    with pytest.raises(ValueError):
+        PooledSqliteSaver(":memory:")
+
+
+@pytest.mark.parametrize("keep_last", [0, -1])
+def test_keep_last_must_keep_the_newest_checkpoint(keep_last):
+    with pytest.raises(ValueError):
+        RetentionPolicy(keep_last=keep_last)
+
+
+def test_retention_keeps_history_readable(path):
+    with PooledSqliteSaver(path, snapshot_every=3) as saver:
+        app = graph(saver)
+        run(app)
+        before = history(app)
+        report = saver.apply_retention(RetentionPolicy(keep_last=4, keep_branch_points=False, keep_interrupts=False))
+        assert report["deleted"] == len(before) - 4 and report["kept"] == 4
+        latest = [state[:3] for state in before[:4]]
+        assert [state[:3] for state in history(app)] == latest
+    with PooledSqliteSaver(path) as reopened:
+        assert [state[:3] for state in history(graph(reopened))] == latest
+
+
+def checkpoints(*entries):
+    """[(thread_ts, parent_ts, metadata)], newest first, from (ts, parent, source, writes)"""
+    return [(ts, parent, {"source": source, "writes": writes}) for ts, parent, source, writes in entries]
+
+
+def test_policy_keep():
+    # 1 <- 2 <- 3 <- 4 <- 5, and 2 <- 6 (update_state on 2, newest)
+    history = checkpoints(("6", "2", "update", None), ("5", "4", "loop", {"llm": {}}), ("4", "3", "loop", {"action": {}}),
+                          ("3", "2", "loop", {"llm": {}}), ("2", "1", "loop", {"action": {}}), ("1", None, "input", None))
+    assert RetentionPolicy(keep_last=2, keep_branch_points=False, keep_interrupts=False).keep(history) == {"6", "5"}
+    assert RetentionPolicy(keep_last=1, keep_interrupts=False).keep(history) == {"6", "2"}
+    assert RetentionPolicy(keep_last=1, keep_branch_points=False).keep(history) == {"6", "2"}
+    assert RetentionPolicy(keep_last=1, keep_branch_points=False, interrupt_nodes=["action"]).keep(history) \
+        == {"6", "4", "2"}
+    assert RetentionPolicy(keep_last=10).keep(history) == {"1", "2", "3", "4", "5", "6"}
+
+
+def fill(saver, thread_id, steps, size=10):
+    config = {"configurable": {"thread_id": thread_id}}
+    messages = []
+    for step in range(steps):
+        messages = messages + [HumanMessage(content="{} step {} ".format(thread_id, step) * size)]
+        config = saver.put(config, _checkpoint(step, messages), {"source": "loop", "step": step})
+    saver.flush()
+    return messages
+
+
+def rows(saver, thread_id):
+    return saver.writer.execute("SELECT thread_ts, depth FROM checkpoints WHERE thread_id = ? ORDER BY thread_ts",
+                                (thread_id,)).fetchall()
+
+
+def test_dry_run_reports_what_retention_does(path):
+    with PooledSqliteSaver(path, snapshot_every=4) as saver:
+        for i in range(3):
+            fill(saver, "t{}".format(i), 10 + i)
+        policy = RetentionPolicy(keep_last=3)
+        dry = saver.apply_retention(policy, dry_run=True)
+        assert sum(len(rows(saver, "t{}".format(i))) for i in range(3)) == 33
+        report = saver.apply_retention(policy)
+        assert dry == dict(report, dry_run=True)
+        assert report["deleted"] == 24 and report["kept"] == 9 and report["threads"] == 3 and report["bytes"] > 0
+        assert [len(rows(saver, "t{}".format(i))) for i in range(3)] == [3, 3, 3]
+        assert saver.apply_retention(policy)["deleted"] == 0
+
+
+def test_deltas_of_deleted_checkpoints_are_rewritten(path):
+    with PooledSqliteSaver(path, snapshot_every=100) as saver:
+        messages = fill(saver, "a", 10)
+        assert [depth for _, depth in rows(saver, "a")] == list(range(10))
+        report = saver.apply_retention(RetentionPolicy(keep_last=3))
+        assert report["rewritten"] == 1
+        # the oldest kept checkpoint is full now, the other two are still deltas of it
+        assert [depth for _, depth in rows(saver, "a")] == [0, 8, 9]
+        saver.cache.clear()
+        listed = list(saver.list({"configurable": {"thread_id": "a"}}))
+        assert [t.checkpoint["channel_values"]["messages"] for t in listed] == [messages, messages[:9], messages[:8]]
+    with PooledSqliteSaver(path) as reopened:
+        latest = reopened.get_tuple({"configurable": {"thread_id": "a"}})
+        assert latest.checkpoint["channel_values"]["messages"] == messages
+
+
+def test_idle_threads_expire(path):
+    with PooledSqliteSaver(path) as saver:
+        fill(saver, "idle", 5)
+        fill(saver, "active", 5)
+        now = saver.writer.execute("SELECT MAX(created_at) FROM checkpoints").fetchone()[0]
+        policy = RetentionPolicy(keep_last=10, idle_ttl=3600)
+        assert saver.apply_retention(policy, now=now + 1800)["deleted"] == 0
+        saver.writer.execute("UPDATE checkpoints SET created_at = created_at - 7200 WHERE thread_id = 'idle'")
+        saver.writer.commit()
+        report = saver.apply_retention(policy, now=now + 1800)
+        assert report["expired_threads"] == ["idle"] and report["deleted"] == 5
+        assert saver.thread_ids() == ["active"]
+        assert saver.get_tuple({"configurable": {"thread_id": "idle"}}) is None
+
+
+def test_vacuum_shrinks_the_file(path):
+    with PooledSqliteSaver(path, delta_channels=()) as saver:
+        for i in range(4):
+            fill(saver, "t{}".format(i), 30, size=100)
+        saver.vacuum()
+        size = saver.stats()["size"]
+        saver.apply_retention(RetentionPolicy(keep_last=1))
+        assert saver.vacuum(10 ** 6) > 0
+        assert saver.stats()["size"] < size / 4
+        assert os.path.getsize(path + "-wal") == 0
+        assert len(saver.get_tuple({"configurable": {"thread_id": "t0"}}).checkpoint["channel_values"]["messages"]) == 30
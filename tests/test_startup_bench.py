@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+import pytest
+
+import startup_bench
+
+
+@pytest.mark.parametrize("module", sorted(startup_bench.BUDGETS))
+def test_import_within_budget(module):
+    assert startup_bench.check(module, startup_bench.BUDGETS[module]) == []
+
+
+def test_module_imported_at_startup_is_reported():
+    with pytest.raises(RuntimeError, match="no import of sys"):
+        startup_bench.import_times("sys", runs=1)
+
+
+def test_in_ipython_does_not_import_ipython():
+    code = "import sys, graph_display; assert not graph_display.in_ipython(); assert 'IPython' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], cwd=startup_bench.SRC, check=True)